@@ -8,10 +8,12 @@ class Config:
     IBKR_HOST = os.getenv('IBKR_HOST', '127.0.0.1')
     IBKR_PORT = int(os.getenv('IBKR_PORT', '7497'))
     IBKR_CLIENT_ID = int(os.getenv('IBKR_CLIENT_ID', '1'))
+    IBKR_MAX_MSGS_PER_SEC = int(os.getenv('IBKR_MAX_MSGS_PER_SEC', '45'))  # TWS limit is 50
     
     # WebSocket Settings
     WEBSOCKET_HOST = os.getenv('WEBSOCKET_HOST', 'localhost')
     WEBSOCKET_PORT = int(os.getenv('WEBSOCKET_PORT', '8765'))
+    SNAPSHOT_CACHE_TTL = float(os.getenv('SNAPSHOT_CACHE_TTL', '0.5'))
     
     # Update Settings
     UPDATE_INTERVAL = int(os.getenv('UPDATE_INTERVAL', '5'))
@@ -1,7 +1,9 @@
+import itertools
+import logging
 import threading
-import json
+import time
 from datetime import datetime
-from typing import Dict, List, Any
+from typing import Dict, List, Any, Callable
 from utils.logger import setup_logger, log_error
 
 class DataStore:
@@ -9,7 +11,12 @@ class DataStore:
     
     def __init__(self):
         self.logger = setup_logger('data_store')
-        self._lock = threading.RLock()
+        
+        # One lock per collection so writers of one don't stall readers of another;
+        # anything needing several takes them in this order: positions, etfs, watchlist
+        self._positions_lock = threading.Lock()
+        self._etfs_lock = threading.Lock()
+        self._watchlist_lock = threading.Lock()
         
         # Core data structures
         self.positions = {}  # position_id -> position_data
@@ -18,79 +25,193 @@ class DataStore:
         self.accounts = {}   # account_id -> account_data
         
         # Meta data
-        self.last_update = datetime.now()
+        self._last_update_ns = time.time_ns()  # Formatted only when read, see last_update
         self.connection_status = False
+        self._version_counter = itertools.count(1)  # next() is atomic, so writers under different locks can't lose a bump
+        self.version = 0  # Bumped on every mutation
+        self._positions_version = 0  # Last version that touched positions
+        self._etfs_version = 0
+        self._watchlist_version = 0
+        self._summary_cache = (-1, None)  # (positions version, summary)
+        self._snapshot_parts = {}  # collection -> (collection version, copy)
+        
+        # Listeners notified when a previously unseen position arrives
+        self._new_position_callbacks = []
+        # Listeners notified when update_position(s) merges into an existing position
+        self._position_update_callbacks = []
         
         self.logger.info("DataStore initialized")
     
+    @property
+    def last_update(self) -> datetime:
+        """Time of the last mutation"""
+        return datetime.fromtimestamp(self._last_update_ns / 1e9)
+    
+    def register_new_position_callback(self, callback: Callable):
+        """Register callback invoked with a copy of each newly added position"""
+        self._new_position_callbacks.append(callback)
+    
+    def _notify_new_positions(self, positions: List[Dict]):
+        """Trigger new position callbacks"""
+        for callback in self._new_position_callbacks:
+            for position in positions:
+                try:
+                    callback(position)
+                except Exception as e:
+                    log_error(self.logger, e, "New position callback error")
+    
+    def register_position_update_callback(self, callback: Callable):
+        """Register callback invoked with each update merged into an existing position"""
+        self._position_update_callbacks.append(callback)
+    
+    def _notify_position_updates(self, updates: List[Dict]):
+        """Trigger position update callbacks"""
+        for callback in self._position_update_callbacks:
+            for update in updates:
+                try:
+                    callback(update)
+                except Exception as e:
+                    log_error(self.logger, e, "Position update callback error")
+    
     def update_positions(self, positions_data: List[Dict]):
         """Update positions data"""
-        with self._lock:
+        added = []
+        merged = []
+        with self._positions_lock:
             try:
-                new_pos = []
+                new_pos = set()
                 for position in positions_data:
                     pos_id = position.get('id')
                     if pos_id:
-                        new_pos.append(pos_id)
-                        if pos_id not in self.positions:
-                            self.positions[pos_id] = {}
-                        self.positions[pos_id].update(position)
+                        new_pos.add(pos_id)
+                        row = self.positions.get(pos_id)
+                        if row is None:
+                            row = self.positions[pos_id] = {}
+                            added.append(pos_id)
+                        else:
+                            merged.append(position)
+                        row.update(position)
 
-                removed_pos = set(self.positions.keys()) - set(new_pos)
+                removed_pos = self.positions.keys() - new_pos
                 for pos_id in removed_pos:
                     del self.positions[pos_id]
 
-                self.last_update = datetime.now()
-                self.logger.info(f"Updated {len(positions_data)} positions")
+                self.version = self._positions_version = next(self._version_counter)
+                self._last_update_ns = time.time_ns()
+                self.logger.info("Updated %d positions", len(positions_data))
+                added = [self.positions[pos_id].copy() for pos_id in added]
             except Exception as e:
                 log_error(self.logger, e, "Error updating positions")
+                added = []
+                merged = []
+        
+        # Callbacks run outside the lock
+        if added:
+            self._notify_new_positions(added)
+        if merged:
+            self._notify_position_updates(merged)
     
     def update_position(self, position_data: Dict):
         """Update single position"""
-        with self._lock:
+        added = None
+        merged = False
+        with self._positions_lock:
             try:
                 pos_id = position_data.get('id')
                 if pos_id:
-                    if pos_id not in self.positions:
-                        self.positions[pos_id] = {}
-                    self.positions[pos_id].update(position_data)
-                    self.last_update = datetime.now()
+                    row = self.positions.get(pos_id)
+                    if row is None:
+                        row = self.positions[pos_id] = {}
+                        added = pos_id
+                    else:
+                        merged = True
+                    row.update(position_data)
+                    self.version = self._positions_version = next(self._version_counter)
+                    self._last_update_ns = time.time_ns()
+                    if added:
+                        added = row.copy()
             except Exception as e:
                 log_error(self.logger, e, "Error updating single position")
+                added = None
+                merged = False
+        
+        # Callbacks run outside the lock
+        if added:
+            self._notify_new_positions([added])
+        elif merged:
+            self._notify_position_updates([position_data])
+    
+    def patch_positions(self, updates: List[Dict]):
+        """Update fields of existing positions in place; ids no longer in the store are ignored"""
+        # The market service's own repricing path, so update callbacks are deliberately not fired
+        with self._positions_lock:
+            try:
+                patched = 0
+                for update in updates:
+                    position = self.positions.get(update.get('id'))
+                    if position is not None:
+                        position.update(update)
+                        patched += 1
+                
+                if patched:
+                    self.version = self._positions_version = next(self._version_counter)
+                    self._last_update_ns = time.time_ns()
+                    self.logger.debug("Patched %d positions", patched)
+            except Exception as e:
+                log_error(self.logger, e, "Error patching positions")
     
     def update_etfs(self, etf_data: Dict):
         """Update ETF data"""
-        with self._lock:
+        with self._etfs_lock:
             try:
                 self.etfs.update(etf_data)
-                self.last_update = datetime.now()
+                self.version = self._etfs_version = next(self._version_counter)
+                self._last_update_ns = time.time_ns()
             except Exception as e:
                 log_error(self.logger, e, "Error updating ETFs")
     
     def update_watchlist(self, watchlist_data: Dict):
         """Update watchlist data"""
-        with self._lock:
+        with self._watchlist_lock:
             try:
                 self.watchlist.update(watchlist_data)
-                self.last_update = datetime.now()
-                self.logger.debug(f"Updated watchlist: {list(watchlist_data.keys())}")
+                self.version = self._watchlist_version = next(self._version_counter)
+                self._last_update_ns = time.time_ns()
+                if self.logger.isEnabledFor(logging.DEBUG):
+                    self.logger.debug("Updated watchlist: %s", list(watchlist_data.keys()))
             except Exception as e:
                 log_error(self.logger, e, "Error updating watchlist")
     
     def get_snapshot(self) -> Dict:
         """Get complete data snapshot"""
-        with self._lock:
+        with self._positions_lock, self._etfs_lock, self._watchlist_lock:
             return {
-                'positions': list(self.positions.values()),
-                'etfs': self.etfs.copy(),
-                'watchlist': self.watchlist.copy(),
+                'positions': self._snapshot_part('positions', self._positions_version,
+                                                 lambda: list(self.positions.values())),
+                'etfs': self._snapshot_part('etfs', self._etfs_version, self.etfs.copy),
+                'watchlist': self._snapshot_part('watchlist', self._watchlist_version, self.watchlist.copy),
                 'summary': self._calculate_summary(),
                 'last_update': self.last_update.isoformat(),
                 'connection_status': self.connection_status
             }
     
+    def _snapshot_part(self, name: str, version: int, build: Callable) -> Any:
+        """Return the cached copy of a collection, rebuilding it only if it changed since"""
+        # The caller holds the collection's lock, so version and copy always match
+        cached_version, part = self._snapshot_parts.get(name, (-1, None))
+        if cached_version != version:
+            part = build()
+            self._snapshot_parts[name] = (version, part)
+        return part
+    
     def _calculate_summary(self) -> Dict:
-        """Calculate portfolio summary"""
+        """Calculate portfolio summary, reusing the last one while positions are unchanged"""
+        # Called under the positions lock, so no update can land between this read and the sum
+        positions_version = self._positions_version
+        cached_version, summary = self._summary_cache
+        if cached_version == positions_version:
+            return summary
+        
         total_value = 0
         total_pnl = 0
         total_day_pnl = 0
@@ -101,7 +222,7 @@ class DataStore:
             total_pnl += position.get('unrealized_pnl', 0)
             total_day_pnl += position.get('day_pnl', 0)
         
-        return {
+        summary = {
             'total_value': total_value,
             'total_pnl': total_pnl,
             'total_pnl_pct': (total_pnl / total_value * 100) if total_value > 0 else 0,
@@ -109,23 +230,42 @@ class DataStore:
             'total_day_pnl_pct': (total_day_pnl / total_value * 100) if total_value > 0 else 0,
             'position_count': position_count
         }
+        self._summary_cache = (positions_version, summary)
+        return summary
     
     def set_connection_status(self, status: bool):
         """Update connection status"""
-        with self._lock:
+        # A single attribute store; no collection lock needed
+        if status != self.connection_status:
             self.connection_status = status
+            self.version = next(self._version_counter)
     
     def get_positions(self) -> List[Dict]:
         """Get all positions"""
-        with self._lock:
+        with self._positions_lock:
             return list(self.positions.values())
     
+    def get_position(self, position_id: str) -> Dict:
+        """Get a single position by ID"""
+        with self._positions_lock:
+            position = self.positions.get(position_id)
+            return position.copy() if position else {}
+    
+    def get_counts(self) -> Dict:
+        """Get item counts without copying the underlying data"""
+        # len() of a dict is atomic; no lock needed for a point-in-time count
+        return {
+            'positions_count': len(self.positions),
+            'etfs_count': len(self.etfs),
+            'watchlist_count': len(self.watchlist)
+        }
+    
     def get_etfs(self) -> Dict:
         """Get ETF data"""
-        with self._lock:
+        with self._etfs_lock:
             return self.etfs.copy()
     
     def get_watchlist(self) -> Dict:
         """Get watchlist data"""
-        with self._lock:
+        with self._watchlist_lock:
             return self.watchlist.copy()
\ No newline at end of file
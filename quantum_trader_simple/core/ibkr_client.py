@@ -1,7 +1,7 @@
+import sys
 import threading
 import time
-from datetime import datetime
-from typing import Dict, List, Optional, Callable
+from typing import Callable
 from ibapi.client import EClient
 from ibapi.wrapper import EWrapper
 from ibapi.contract import Contract
@@ -10,6 +10,30 @@ from ibapi.ticktype import TickTypeEnum
 from config import Config
 from utils.logger import setup_logger, log_error
 
+# Account values forwarded to account callbacks
+ACCOUNT_KEYS = frozenset(['CashBalance', 'BuyingPower', 'NetLiquidation',
+                          'GrossPositionValue', 'TotalCashValue', 'AvailableFunds'])
+
+# Informational error codes (farm connection notices) and codes that mean the link is down
+INFO_CODES = frozenset([2104, 2106, 2158, 2168])
+CONNECTION_ERROR_CODES = frozenset([502, 503, 504, 1100, 1101, 1102])
+
+# Tick type -> market_data field, live and delayed ticks share a field
+PRICE_TICK_FIELDS = {
+    TickTypeEnum.LAST: 'last_price', TickTypeEnum.DELAYED_LAST: 'last_price',
+    TickTypeEnum.BID: 'bid', TickTypeEnum.DELAYED_BID: 'bid',
+    TickTypeEnum.ASK: 'ask', TickTypeEnum.DELAYED_ASK: 'ask',
+    TickTypeEnum.HIGH: 'high', TickTypeEnum.DELAYED_HIGH: 'high',
+    TickTypeEnum.LOW: 'low', TickTypeEnum.DELAYED_LOW: 'low',
+    TickTypeEnum.CLOSE: 'close', TickTypeEnum.DELAYED_CLOSE: 'close',
+}
+SIZE_TICK_FIELDS = {
+    TickTypeEnum.VOLUME: 'volume', TickTypeEnum.DELAYED_VOLUME: 'volume',
+    TickTypeEnum.BID_SIZE: 'bid_size', TickTypeEnum.DELAYED_BID_SIZE: 'bid_size',
+    TickTypeEnum.ASK_SIZE: 'ask_size', TickTypeEnum.DELAYED_ASK_SIZE: 'ask_size',
+}
+MODEL_OPTION_TICKS = frozenset([TickTypeEnum.MODEL_OPTION, TickTypeEnum.DELAYED_MODEL_OPTION])
+
 class IBKRWrapper(EWrapper):
     """IBKR API Event Handler"""
     
@@ -23,6 +47,7 @@ class IBKRWrapper(EWrapper):
         self.connection_ready = False
         self.next_valid_order_id = 1
         self.managed_accounts = ""
+        self.managed_account_ids = ()  # Parsed once from managed_accounts, swapped in whole
         
         # Data storage
         self.market_data = {}
@@ -32,7 +57,6 @@ class IBKRWrapper(EWrapper):
         
         # Request tracking
         self.req_id_to_symbol = {}
-        self.symbol_to_req_id = {}
         
         # Callbacks
         self.callbacks = {
@@ -80,28 +104,20 @@ class IBKRWrapper(EWrapper):
     
     def managedAccounts(self, accountsList: str):
         self.managed_accounts = accountsList
+        self.managed_account_ids = tuple(
+            account.strip() for account in accountsList.split(',') if account.strip()
+        )
         self.logger.info(f"Managed accounts: {accountsList}")
     
     # Market Data Events
     def tickPrice(self, reqId: TickerId, tickType: int, price: float, attrib):
-        if reqId not in self.market_data:
-            self.market_data[reqId] = {}
-        
         symbol = self.req_id_to_symbol.get(reqId, f"REQ_{reqId}")
-        tick_data = self.market_data[reqId]
+        # Preallocated by request_*market_data; setdefault covers any other id
+        tick_data = self.market_data.setdefault(reqId, {})
 
-        if tickType in [TickTypeEnum.LAST, TickTypeEnum.DELAYED_LAST]:
-            tick_data['last_price'] = price
-        elif tickType in [TickTypeEnum.BID, TickTypeEnum.DELAYED_BID]:
-            tick_data['bid'] = price
-        elif tickType in [TickTypeEnum.ASK, TickTypeEnum.DELAYED_ASK]:
-            tick_data['ask'] = price
-        elif tickType in [TickTypeEnum.HIGH, TickTypeEnum.DELAYED_HIGH]:
-            tick_data['high'] = price
-        elif tickType in [TickTypeEnum.LOW, TickTypeEnum.DELAYED_LOW]:
-            tick_data['low'] = price
-        elif tickType in [TickTypeEnum.CLOSE, TickTypeEnum.DELAYED_CLOSE]:
-            tick_data['close'] = price
+        field = PRICE_TICK_FIELDS.get(tickType)
+        if field:
+            tick_data[field] = price
 
         self._trigger_callbacks('market_data', {
             'symbol': symbol,
@@ -112,18 +128,13 @@ class IBKRWrapper(EWrapper):
         })
     
     def tickSize(self, reqId: TickerId, tickType: int, size: int):
-        if reqId not in self.market_data:
-            self.market_data[reqId] = {}
-        
         symbol = self.req_id_to_symbol.get(reqId, f"REQ_{reqId}")
-        tick_data = self.market_data[reqId]
+        # Preallocated by request_*market_data; setdefault covers any other id
+        tick_data = self.market_data.setdefault(reqId, {})
         
-        if tickType in [TickTypeEnum.VOLUME, TickTypeEnum.DELAYED_VOLUME]:
-            tick_data['volume'] = size
-        elif tickType in [TickTypeEnum.BID_SIZE, TickTypeEnum.DELAYED_BID_SIZE]:
-            tick_data['bid_size'] = size
-        elif tickType in [TickTypeEnum.ASK_SIZE, TickTypeEnum.DELAYED_ASK_SIZE]:
-            tick_data['ask_size'] = size
+        field = SIZE_TICK_FIELDS.get(tickType)
+        if field:
+            tick_data[field] = size
         
         self._trigger_callbacks('market_data', {
             'symbol': symbol,
@@ -138,15 +149,12 @@ class IBKRWrapper(EWrapper):
                              pvDividend: float, gamma: float, vega: float,
                              theta: float, undPrice: float):
         symbol = self.req_id_to_symbol.get(reqId, f"REQ_{reqId}")
-        if reqId not in self.greeks_data:
-            self.greeks_data[reqId] = {}
-
-        greeks_data = self.greeks_data[reqId]
+        greeks_data = self.greeks_data.setdefault(reqId, {})
 
         greeks_data['symbol'] = symbol
         greeks_data['req_id'] = reqId
 
-        if tickType in [TickTypeEnum.MODEL_OPTION, TickTypeEnum.DELAYED_MODEL_OPTION]:  # Model option computation
+        if tickType in MODEL_OPTION_TICKS:  # Model option computation
             if delta:
                 greeks_data['delta'] = delta
             if gamma:
@@ -160,8 +168,6 @@ class IBKRWrapper(EWrapper):
             if optPrice:
                 greeks_data['optPrice'] = optPrice
 
-            self.greeks_data[reqId] = greeks_data
-
             self._trigger_callbacks('market_data', {
                 'symbol': symbol,
                 'type': 'greeks',
@@ -182,16 +188,13 @@ class IBKRWrapper(EWrapper):
             'unrealized_pnl': unrealizedPNL,
             'realized_pnl': realizedPNL,
             'account': accountName,
-            'timestamp': datetime.now()
+            'timestamp': time.time()
         }
         
         self._trigger_callbacks('position_update', position_data)
     
     def updateAccountValue(self, key: str, val: str, currency: str, accountName: str):
-        important_keys = ['CashBalance', 'BuyingPower', 'NetLiquidation', 
-                         'GrossPositionValue', 'TotalCashValue', 'AvailableFunds']
-        
-        if key in important_keys:
+        if key in ACCOUNT_KEYS:
             self._trigger_callbacks('account_update', {
                 'account': accountName,
                 'key': key,
@@ -207,23 +210,21 @@ class IBKRWrapper(EWrapper):
     
     def contractDetails(self, reqId: TickerId, contractDetails):
         """Handle contract details response"""
-        self.logger.debug(f"Received contract details for ReqId {reqId}: {contractDetails}")
+        self.logger.debug("Received contract details for ReqId %s: %s", reqId, contractDetails)
 
     def contractDetailsEnd(self, reqId:int):
         """This function is called once all contract details for a given
         request are received. This helps to define the end of an option
         chain."""
-        self.logger.debug(f"Contract details download completed for ReqId {reqId}")  
+        self.logger.debug("Contract details download completed for ReqId %s", reqId)  
 
     # Error Handling
     def error(self, reqId: TickerId, errorCode: int, errorString: str, advancedOrderRejectJson: str = ""):
-        info_codes = [2104, 2106, 2158, 2168]
-        if errorCode in info_codes:
-            self.logger.debug(f"IBKR Info: {errorString} (Code: {errorCode})")
+        if errorCode in INFO_CODES:
+            self.logger.debug("IBKR Info: %s (Code: %s)", errorString, errorCode)
             return
         
-        connection_errors = [502, 503, 504, 1100, 1101, 1102]
-        if errorCode in connection_errors:
+        if errorCode in CONNECTION_ERROR_CODES:
             self.connected = False
             self.connection_ready = False
             self.connection_event.clear()
@@ -249,6 +250,28 @@ class IBKRClient(EClient):
         # Request ID management
         self.next_req_id = 1000
         self._req_id_lock = threading.Lock()
+        
+        # Outgoing message pacing (token bucket refilled at IBKR_MAX_MSGS_PER_SEC)
+        self._pacing_lock = threading.Lock()
+        self._pacing_tokens = float(Config.IBKR_MAX_MSGS_PER_SEC)
+        self._pacing_last = time.monotonic()
+        
+        # Session market data type; resent only when a request needs a different one
+        self._market_data_type = None
+        self._market_data_lock = threading.Lock()
+    
+    def acquire_pacing(self, messages: int = 1):
+        """Block until the given number of outgoing messages fits the IBKR rate limit"""
+        rate = Config.IBKR_MAX_MSGS_PER_SEC
+        with self._pacing_lock:
+            while True:
+                now = time.monotonic()
+                self._pacing_tokens = min(rate, self._pacing_tokens + (now - self._pacing_last) * rate)
+                self._pacing_last = now
+                if self._pacing_tokens >= messages:
+                    self._pacing_tokens -= messages
+                    return
+                time.sleep((messages - self._pacing_tokens) / rate)
     
     def get_next_req_id(self) -> int:
         with self._req_id_lock:
@@ -264,6 +287,7 @@ class IBKRClient(EClient):
             self.wrapper.connected = False
             self.wrapper.connection_ready = False
             self.wrapper.connection_event.clear()
+            self._market_data_type = None
             
             self.connect(Config.IBKR_HOST, Config.IBKR_PORT, Config.IBKR_CLIENT_ID)
 
@@ -298,6 +322,10 @@ class IBKRClient(EClient):
         except Exception as e:
             log_error(self.logger, e, "Disconnect error")
     
+    def wait_until_ready(self, timeout: float = None) -> bool:
+        """Block until the connection handshake has completed (or timeout)"""
+        return self.wrapper.connection_event.wait(timeout=timeout) and self.is_connected()
+    
     def is_connected(self) -> bool:
         return (self.wrapper.connected and 
                 self.wrapper.connection_ready and 
@@ -306,21 +334,35 @@ class IBKRClient(EClient):
     def qualify_contract(self, contract: Contract):
         """Qualify a contract to ensure it is valid"""
         req_id = self.get_next_req_id()
+        self.acquire_pacing()
         self.reqContractDetails(req_id,contract)
 
+    def _request_mkt_data(self, req_id: int, contract: Contract, market_data_type: int,
+                          generic_ticks: str, snapshot: bool):
+        """Send reqMktData, switching the session market data type first only if needed"""
+        # Held across both calls so another thread can't switch the type in between
+        with self._market_data_lock:
+            if self._market_data_type != market_data_type:
+                self.acquire_pacing()
+                self.reqMarketDataType(market_data_type)
+                self._market_data_type = market_data_type
+            
+            self.acquire_pacing()
+            self.reqMktData(req_id, contract, generic_ticks, snapshot, False, [])
+    
     def request_market_data(self, symbol: str, contract: Contract, snapshot: bool = True) -> int:
         if not self.is_connected():
             return -1
         
         try:
             req_id = self.get_next_req_id()
+            # Interned so every tick callback hands out the same key object
+            symbol = sys.intern(symbol)
             self.wrapper.req_id_to_symbol[req_id] = symbol
-            self.wrapper.symbol_to_req_id[symbol] = req_id
+            self.wrapper.market_data[req_id] = {}  # Preallocated so tick handlers skip the insert
 
-            self.reqMarketDataType(3)
-            
-            self.reqMktData(req_id, contract, "", True, False, [])
-            self.logger.debug(f"Requested market data for {symbol} (ReqId: {req_id})")
+            self._request_mkt_data(req_id, contract, 3, "", True)
+            self.logger.debug("Requested market data for %s (ReqId: %s)", symbol, req_id)
             return req_id
         except Exception as e:
             log_error(self.logger, e, f"Error requesting market data for {symbol}")
@@ -331,14 +373,13 @@ class IBKRClient(EClient):
             return -1
         try:
             req_id = self.get_next_req_id()
+            # Interned so every tick callback hands out the same key object
+            symbol = sys.intern(symbol)
             self.wrapper.req_id_to_symbol[req_id] = symbol
-            self.wrapper.symbol_to_req_id[symbol] = req_id
+            self.wrapper.market_data[req_id] = {}  # Preallocated so tick handlers skip the insert
 
-            self.reqMarketDataType(1)
-            # self.reqMktData(req_id, contract, "", True, False, [])
-            
-            self.reqMktData(req_id, contract, "100,101,104,105,106", False, False, [])
-            self.logger.debug(f"Requested market data for {symbol} (ReqId: {req_id})")
+            self._request_mkt_data(req_id, contract, 1, "100,101,104,105,106", False)
+            self.logger.debug("Requested market data for %s (ReqId: %s)", symbol, req_id)
             return req_id
         except Exception as e:
             log_error(self.logger, e, f"Error requesting market data for {symbol}")
@@ -347,15 +388,31 @@ class IBKRClient(EClient):
     def cancel_market_data(self, req_id: int):
         try:
             if self.isConnected():
+                self.acquire_pacing()
                 self.cancelMktData(req_id)
         except Exception as e:
             log_error(self.logger, e, "Error cancelling market data")
     
+    def cancel_market_data_batch(self, req_ids) -> int:
+        """Cancel several market data requests in one pass, returns the number sent"""
+        cancelled = 0
+        try:
+            if not self.isConnected():
+                return 0
+            for req_id in req_ids:
+                self.acquire_pacing()
+                self.cancelMktData(req_id)
+                cancelled += 1
+        except Exception as e:
+            log_error(self.logger, e, "Error cancelling market data batch")
+        return cancelled
+    
     def request_positions(self):
         if not self.is_connected():
             return
         
         try:
+            self.acquire_pacing()
             self.reqPositions()
             self.logger.info("Requested all positions")
         except Exception as e:
@@ -366,6 +423,7 @@ class IBKRClient(EClient):
             return
         
         try:
+            self.acquire_pacing()
             self.reqAccountUpdates(True, account_id)
             self.logger.info(f"Requested account updates for {account_id}")
         except Exception as e:
@@ -1,5 +1,6 @@
 import asyncio
 import json
+import time
 import websockets
 import threading
 from datetime import datetime
@@ -19,12 +20,19 @@ class WebSocketServer:
         # Connected clients
         self.clients: Set[WebSocketServerProtocol] = set()
         self.client_info: Dict[WebSocketServerProtocol, Dict] = {}
+        self._clients_info_snapshot = ()  # Rebuilt on connect/disconnect, read by get_stats
         
         # Server state
         self.server = None
         self.running = False
         self.broadcast_task = None
         
+        # Serialized snapshot cache, reused while data is unchanged and fresh
+        self._snapshot_cache = None
+        self._snapshot_cache_ts = 0.0
+        self._snapshot_cache_version = None
+        self._last_broadcast_version = None  # DataStore.version of the last periodic broadcast
+        
         self.logger.info("WebSocket server initialized")
     
     async def register_client(self, websocket: WebSocketServerProtocol, path: str="/"):
@@ -32,10 +40,11 @@ class WebSocketServer:
         try:
             self.clients.add(websocket)
             self.client_info[websocket] = {
-                'connected_at': datetime.now(),
+                'connected_at': datetime.now().isoformat(),  # Formatted once; only ever reported
                 'path': path,
                 'remote_address': websocket.remote_address
             }
+            self._refresh_clients_info()
             
             client_count = len(self.clients)
             self.logger.info(f"Client connected from {websocket.remote_address}. Total clients: {client_count}")
@@ -60,22 +69,49 @@ class WebSocketServer:
         
         if websocket in self.client_info:
             del self.client_info[websocket]
+            self._refresh_clients_info()
         
         client_count = len(self.clients)
         self.logger.info(f"Client disconnected. Total clients: {client_count}")
     
+    def _refresh_clients_info(self):
+        """Rebuild the client stats snapshot (swapped in as a whole)"""
+        self._clients_info_snapshot = tuple(
+            {
+                'address': str(info['remote_address']),
+                'connected_at': info['connected_at'],
+                'path': info['path']
+            }
+            for info in self.client_info.values()
+        )
+    
+    def _get_snapshot_message(self) -> str:
+        """Get serialized snapshot message, reusing a recent one if data is unchanged"""
+        now_mono = time.monotonic()
+        version = self.data_store.version
+        
+        if (self._snapshot_cache is not None and
+                version == self._snapshot_cache_version and
+                now_mono - self._snapshot_cache_ts < Config.SNAPSHOT_CACHE_TTL):
+            return self._snapshot_cache
+        
+        snapshot = self.data_store.get_snapshot()
+        message = {
+            'type': 'snapshot',
+            'data': snapshot,
+            'timestamp': datetime.now().isoformat()
+        }
+        
+        self._snapshot_cache = json.dumps(message)
+        self._snapshot_cache_ts = now_mono
+        self._snapshot_cache_version = version
+        return self._snapshot_cache
+    
     async def send_snapshot(self, websocket: WebSocketServerProtocol):
         """Send initial data snapshot to client"""
         try:
-            snapshot = self.data_store.get_snapshot()
-            message = {
-                'type': 'snapshot',
-                'data': snapshot,
-                'timestamp': datetime.now().isoformat()
-            }
-            
-            await websocket.send(json.dumps(message))
-            self.logger.debug(f"Sent snapshot to {websocket.remote_address}")
+            await websocket.send(self._get_snapshot_message())
+            self.logger.debug("Sent snapshot to %s", websocket.remote_address)
             
         except Exception as e:
             log_error(self.logger, e, "Error sending snapshot")
@@ -155,14 +191,7 @@ class WebSocketServer:
             return
         
         try:
-            snapshot = self.data_store.get_snapshot()
-            message = {
-                'type': 'snapshot',
-                'data': snapshot,
-                'timestamp': datetime.now().isoformat()
-            }
-            
-            await self.broadcast_message(message)
+            await self._send_to_all(self._get_snapshot_message())
             
         except Exception as e:
             log_error(self.logger, e, "Error broadcasting snapshot")
@@ -172,7 +201,10 @@ class WebSocketServer:
         if not self.clients:
             return
         
-        json_message = json.dumps(message)
+        await self._send_to_all(json.dumps(message))
+    
+    async def _send_to_all(self, json_message: str):
+        """Send an already serialized message to all connected clients"""
         disconnected_clients = []
         
         for client in self.clients.copy():
@@ -189,10 +221,13 @@ class WebSocketServer:
             await self.unregister_client(client)
     
     async def periodic_broadcast(self):
-        """Periodic broadcast of data snapshots"""
+        """Periodic broadcast of data snapshots, skipped while the data is unchanged"""
         while self.running:
             try:
-                await self.broadcast_snapshot()
+                version = self.data_store.version
+                if self.clients and version != self._last_broadcast_version:
+                    await self.broadcast_snapshot()
+                    self._last_broadcast_version = version
                 await asyncio.sleep(Config.UPDATE_INTERVAL)
             except Exception as e:
                 log_error(self.logger, e, "Error in periodic broadcast")
@@ -256,14 +291,7 @@ class WebSocketServer:
         return {
             'connected_clients': len(self.clients),
             'running': self.running,
-            'clients_info': [
-                {
-                    'address': str(info['remote_address']),
-                    'connected_at': info['connected_at'].isoformat(),
-                    'path': info['path']
-                }
-                for info in self.client_info.values()
-            ]
+            'clients_info': self._clients_info_snapshot
         }
 
 class WebSocketManager:
@@ -2,6 +2,7 @@ import signal
 import sys
 import time
 import threading
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 from config import Config
 from utils.logger import setup_logger, log_error
@@ -31,10 +32,14 @@ class QuantumTraderSimple:
         # Application state
         self.running = False
         self.start_time = datetime.now()
+        self.start_time_iso = self.start_time.isoformat()
+        self.start_monotonic = time.monotonic()
+        self.shutdown_event = threading.Event()  # Wakes run_forever as soon as stop() is called
         
         # Connection monitoring
         self.connection_monitor_thread = None
         self.last_connection_status = False
+        self.connection_change_event = threading.Event()
         
         self.logger.info("QuantumTrader Simple initialized")
     
@@ -60,13 +65,14 @@ class QuantumTraderSimple:
             self.logger.info("Starting WebSocket server...")
             self.websocket_manager.start()
             
-            # Start connection monitoring
-            self._start_connection_monitoring()
-            
             # Wait for services to initialize
             time.sleep(0.2)
             
             self.running = True
+            
+            # Start connection monitoring
+            self._start_connection_monitoring()
+            
             self.logger.info("QuantumTrader Simple started successfully!")
             
             # Print status
@@ -82,17 +88,20 @@ class QuantumTraderSimple:
         """Stop the application"""
         self.logger.info("Stopping QuantumTrader Simple...")
         self.running = False
+        self.shutdown_event.set()
         
         try:
-            # Stop services
-            self.watchlist_service.stop()
-            self.market_service.stop()
-            self.position_service.stop()
+            # Stop services concurrently so their cancels and thread joins overlap
+            services = (self.watchlist_service, self.market_service, self.position_service)
+            with ThreadPoolExecutor(max_workers=len(services)) as executor:
+                for future in [executor.submit(service.stop) for service in services]:
+                    future.result()
             
             # Stop WebSocket server
             self.websocket_manager.stop()
             
             # Stop connection monitoring
+            self.connection_change_event.set()
             if self.connection_monitor_thread and self.connection_monitor_thread.is_alive():
                 self.connection_monitor_thread.join(timeout=5)
             
@@ -150,9 +159,10 @@ class QuantumTraderSimple:
         self.logger.info("Connection monitoring started")
     
     def _monitor_connection_health(self):
-        """Monitor IBKR connection health"""
+        """Monitor IBKR connection health, woken by connection status events"""
         while self.running:
             try:
+                self.connection_change_event.clear()
                 current_status = self.ibkr_client.is_connected()
                 
                 # Log status changes
@@ -166,8 +176,8 @@ class QuantumTraderSimple:
                 
                 self.last_connection_status = current_status
                 
-                # Sleep between checks
-                time.sleep(30)
+                # Wait for a connection status event, with a slow periodic check as fallback
+                self.connection_change_event.wait(timeout=60)
                 
             except Exception as e:
                 log_error(self.logger, e, "Error in connection monitoring")
@@ -184,6 +194,9 @@ class QuantumTraderSimple:
             elif status in ['disconnected', 'error']:
                 self.data_store.set_connection_status(False)
                 self.logger.warning(f"IBKR connection status: {status}")
+            
+            # Wake the connection monitor
+            self.connection_change_event.set()
         
         # Register connection callback
         self.ibkr_client.register_connection_callback(on_connection_status)
@@ -196,8 +209,12 @@ class QuantumTraderSimple:
         print("🚀 QUANTUMTRADER SIMPLE - BACKEND STARTED")
         print("="*60)
         
+        # One status pass for everything printed below
+        status = self.get_status()
+        services = status['services']
+        
         # Connection status
-        ibkr_status = "✅ Connected" if self.ibkr_client.is_connected() else "❌ Disconnected"
+        ibkr_status = "✅ Connected" if status['ibkr_connected'] else "❌ Disconnected"
         print(f"📡 IBKR Connection: {ibkr_status}")
         
         print(f"🌐 WebSocket Server: ws://{Config.WEBSOCKET_HOST}:{Config.WEBSOCKET_PORT}")
@@ -210,9 +227,9 @@ class QuantumTraderSimple:
         print(f"   Connect to: ws://localhost:{Config.WEBSOCKET_PORT}")
         print("="*60)
         print("📝 Services:")
-        print(f"   - Position Service: {'✅' if self.position_service.is_running() else '❌'}")
-        print(f"   - Market Service: {'✅' if self.market_service.is_running() else '❌'}")
-        print(f"   - Watchlist Service: {'✅' if self.watchlist_service.is_running() else '❌'}")
+        print(f"   - Position Service: {'✅' if services['position'] else '❌'}")
+        print(f"   - Market Service: {'✅' if services['market'] else '❌'}")
+        print(f"   - Watchlist Service: {'✅' if services['watchlist'] else '❌'}")
         print("="*60)
         print("🎯 Available Data:")
         print("   - All positions with real-time P&L")
@@ -225,18 +242,16 @@ class QuantumTraderSimple:
     
     def get_status(self) -> dict:
         """Get current application status"""
-        uptime = (datetime.now() - self.start_time).total_seconds()
+        uptime = time.monotonic() - self.start_monotonic
         
         return {
             'running': self.running,
             'uptime_seconds': uptime,
-            'start_time': self.start_time.isoformat(),
+            'start_time': self.start_time_iso,
             'ibkr_connected': self.ibkr_client.is_connected(),
             'websocket_stats': self.websocket_manager.get_stats(),
             'data_summary': {
-                'positions_count': len(self.data_store.get_positions()),
-                'etfs_count': len(self.data_store.get_etfs()),
-                'watchlist_count': len(self.data_store.get_watchlist()),
+                **self.data_store.get_counts(),
                 'last_update': self.data_store.last_update.isoformat()
             },
             'services': {
@@ -249,12 +264,15 @@ class QuantumTraderSimple:
     def run_forever(self):
         """Run the application indefinitely"""
         try:
+            next_status_log = time.monotonic() + 300
             while self.running:
-                time.sleep(0.1)
+                # Sleep until the next status log; stop() ends the wait early
+                if self.shutdown_event.wait(timeout=max(0.0, next_status_log - time.monotonic())):
+                    break
                 
                 # Periodic status logging (every 5 minutes)
-                if int(time.time()) % 300 == 0:
-                    self._log_periodic_status()
+                self._log_periodic_status()
+                next_status_log += 300
                 
         except KeyboardInterrupt:
             self.logger.info("Received shutdown signal")
@@ -1,12 +1,36 @@
+import queue
+import random
+from collections import defaultdict, deque
 import threading
 import time
 from datetime import datetime
-from typing import Dict, List, Set
+from typing import Dict, NamedTuple
 from config import Config
 from utils.logger import setup_logger, log_error
 from core.ibkr_client import IBKRClient
 from core.data_store import DataStore
 
+# ETF/index symbol -> (IBKR contract symbol, security type, exchange)
+ETF_CONTRACT_SPECS = {
+    'SPY': ('SPY', 'STK', 'SMART'),
+    'QQQ': ('QQQ', 'STK', 'NASDAQ'),
+    'VIX': ('VIX', 'IND', 'CBOE'),
+    '^IXIC': ('COMP', 'IND', 'NASDAQ'),  # NASDAQ Composite
+    '^TNX': ('TNX', 'IND', 'CBOE')       # 10-Year Treasury
+}
+
+OPTION_POSITION_TYPES = frozenset(('call', 'put'))
+POSITION_MULTIPLIERS = {'call': 100, 'put': 100}  # Contract multiplier by position type, 1 if absent
+
+# Failed Greeks subscriptions back off after this many attempts until the cooldown expires
+OPTION_RETRY_LIMIT = 3
+OPTION_RETRY_COOLDOWN = 300  # seconds since the first failure
+
+class Subscription(NamedTuple):
+    """Latest market data request for a symbol"""
+    req_id: int
+    streaming: bool  # Streaming requests must be cancelled, snapshots end on their own
+
 class MarketService:
     """Service for managing market data and ETFs"""
     
@@ -18,20 +42,39 @@ class MarketService:
         # Service state
         self.running = False
         self.service_thread = None
+        self._wake = threading.Event()  # Set to cut the loop's interval sleep short
         
         # Market data tracking
-        self.subscribed_symbols = set()
-        self.symbol_to_req_id = {}
-        self.req_id_to_symbol = {}
-        self.market_data_cache = {}
+        # Copy-on-write: adding or clearing symbols publishes a new dict, so readers on
+        # other threads can use whatever reference they grabbed without locking
+        self.subscriptions: Dict[str, Subscription] = {}  # symbol -> latest request
+        self._symbols_snapshot = ()  # Tuple of subscribed symbols, published with the dict
+        self._subscriptions_lock = threading.Lock()  # Serializes writers only
+        self.market_data_cache = defaultdict(dict)  # symbol -> merged tick fields
+        # option_key -> frozenset of position ids (one per account), for Greeks lookup. Copy-on-write:
+        # the IBKR thread iterates whatever set it grabbed while the service thread publishes new ones
+        self.option_key_to_position_ids: Dict[str, frozenset] = {}
+        self.position_id_to_option_key = {}  # position id -> option_key, built once per option
+        self.subscribed_options = {}         # (symbol, strike, expiry, right) -> option_key with live Greeks stream
+        self.new_option_positions = queue.SimpleQueue()  # Pushed by the data store as option positions appear
+        self.new_position_symbols = deque()  # Unsubscribed stock/future symbols of new positions, same source
+        self.pending_option_positions = {}   # position id -> option position still awaiting a Greeks subscription
+        self.option_failures = {}            # position id -> (failure count, time.monotonic() of first failure)
+        self.stock_contracts = {}            # symbol -> stock Contract, kept across cancels and restarts
+        self.option_contracts = {}           # (symbol, strike, expiry, right) -> option Contract, reused on retries
         
         # ETF contracts
         self.etf_contracts = {}
         self.etf_data = {}
+        self.etf_ticks = deque()  # ETF symbols ticked since the last store update (appended by the IBKR thread)
+        self.price_ticks = deque()  # Symbols/option keys whose last price ticked since the last position pass
+        self.greeks_ticks = deque()  # (position id, greeks) from the IBKR thread, written to the store in one batch
         
         # Update timing
         self.last_market_update = datetime.min
-        self.last_etf_update = datetime.min
+        self.last_etf_update = float('-inf')  # time.monotonic() of last ETF request
+        self.last_etf_update_iso = datetime.min.isoformat()  # Wall-clock counterpart, for stats only
+        self.last_position_refresh = float('-inf')  # time.monotonic() of last full position snapshot round
         
         self.logger.info("Market service initialized")
     
@@ -42,12 +85,13 @@ class MarketService:
             return
         
         self.running = True
-        self.service_thread = threading.Thread(target=self._run_service, daemon=True)
-        self.service_thread.start()
         
-        # Setup callbacks
+        # Setup callbacks before the thread can issue its first requests
         self._setup_callbacks()
         
+        self.service_thread = threading.Thread(target=self._run_service, daemon=True)
+        self.service_thread.start()
+        
         self.logger.info("Market service started")
     
     def stop(self):
@@ -56,6 +100,7 @@ class MarketService:
             return
         
         self.running = False
+        self._wake.set()
         
         # Cancel all subscriptions
         self._cancel_all_subscriptions()
@@ -69,29 +114,43 @@ class MarketService:
         """Main service loop"""
         try:
             # Initial setup
-            time.sleep(0.3)  # Wait for connection
+            if not self.ibkr_client.wait_until_ready(timeout=30):
+                self.logger.warning("IBKR connection not ready, continuing anyway")
             self._setup_etf_contracts()
             self._subscribe_to_etfs()
             
+            interval = Config.MARKET_DATA_INTERVAL
+            error_backoff = 0.5
             while self.running:
                 try:
-                    current_time = datetime.now()
+                    self._wake.clear()
+                    now_mono = time.monotonic()
                     
                     # Update ETF data periodically
-                    if (current_time - self.last_etf_update).total_seconds() >= Config.MARKET_DATA_INTERVAL:
+                    if now_mono - self.last_etf_update >= interval:
                         self._request_etf_data()
-                        self.last_etf_update = current_time
+                        self.last_etf_update = now_mono
+                        self.last_etf_update_iso = datetime.now().isoformat()
                     
-                    # Subscribe to position symbols
-                    self._subscribe_to_position_symbols()
-                    time.sleep(Config.MARKET_DATA_INTERVAL//2)
+                    # Subscribe to position symbols; re-snapshot all of them only once per interval,
+                    # a wake for new positions just picks those up
+                    refresh_due = now_mono - self.last_position_refresh >= interval
+                    self._subscribe_to_position_symbols(refresh_due)
+                    if refresh_due:
+                        self.last_position_refresh = now_mono
+                    
+                    # Wait for the next interval, or less if a new position shows up
+                    self._wake.wait(timeout=interval//2)
                     
                     # Update market data in data store
                     self._update_market_data_store()
+                    error_backoff = 0.5
                     
                 except Exception as e:
                     log_error(self.logger, e, "Error in market service loop")
-                    time.sleep(1)
+                    # Exponential backoff with jitter; stop() cuts it short via _wake
+                    self._wake.wait(timeout=error_backoff + random.uniform(0, error_backoff * 0.1))
+                    error_backoff = min(error_backoff * 2, 30.0)
                     
         except Exception as e:
             log_error(self.logger, e, "Fatal error in market service")
@@ -99,19 +158,38 @@ class MarketService:
     def _setup_callbacks(self):
         """Setup IBKR callbacks"""
         self.ibkr_client.register_market_data_callback(self._on_market_data_update)
+        self.data_store.register_new_position_callback(self.notify_new_position)
+        self.data_store.register_position_update_callback(self.notify_position_update)
+        
+        # Positions that arrived before the callback was registered
+        for position in self.data_store.get_positions():
+            self.notify_new_position(position)
+    
+    def notify_new_position(self, position: Dict):
+        """Queue a new position and wake the service loop if it needs a subscription right away"""
+        if position.get('position_type') in OPTION_POSITION_TYPES:
+            self.new_option_positions.put(position)
+            self._wake.set()
+            return
+        
+        # Apply an already cached price on the next pass
+        symbol = position.get('symbol')
+        self.price_ticks.append(symbol)
+        # A symbol already held in another account is covered by the regular refresh
+        if symbol and symbol not in self.subscriptions:
+            self.new_position_symbols.append(symbol)
+            self._wake.set()
+    
+    def notify_position_update(self, update: Dict):
+        """Reapply the cached price on the next pass after a portfolio update overwrote it"""
+        key = self.position_id_to_option_key.get(update.get('id')) or update.get('symbol')
+        if key:
+            self.price_ticks.append(key)
     
     def _setup_etf_contracts(self):
         """Setup ETF contracts"""
-        etf_mapping = {
-                'SPY': ('SPY', 'STK', 'SMART'),
-                'QQQ': ('QQQ', 'STK' ,'NASDAQ'), 
-                'VIX': ('VIX', 'IND', 'CBOE'),
-                '^IXIC': ('COMP', 'IND', 'NASDAQ'),  # NASDAQ Composite
-                '^TNX': ('TNX', 'IND', 'CBOE')     # 10-Year Treasury
-            }
-
         try:
-            for symbol, (contract_symbol, sec_type, exchange) in etf_mapping.items():
+            for symbol, (contract_symbol, sec_type, exchange) in ETF_CONTRACT_SPECS.items():
                 if sec_type == 'IND':
                     # Index
                     contract = self.ibkr_client.create_index_contract(contract_symbol, exchange)
@@ -130,10 +208,8 @@ class MarketService:
         """Subscribe to ETF market data"""
         try:
             for symbol, contract in self.etf_contracts.items():
-                if symbol not in self.subscribed_symbols:
-                    req_id = self._subscribe_to_symbol(symbol, contract)
-                    if req_id != -1:
-                        time.sleep(0.2)  # Rate limiting
+                if symbol not in self.subscriptions:
+                    self._subscribe_to_symbol(symbol, contract)
                         
         except Exception as e:
             log_error(self.logger, e, "Error subscribing to ETFs")
@@ -141,82 +217,139 @@ class MarketService:
     def _request_etf_data(self):
         """Request fresh ETF data"""
         try:
+            if not self.ibkr_client.is_connected():
+                return
+            
             for symbol, contract in self.etf_contracts.items():
-                if self.ibkr_client.is_connected():
-                    req_id = self.ibkr_client.request_market_data(symbol, contract, snapshot=True)
-                    if req_id != -1:
-                        self.symbol_to_req_id[symbol] = req_id
-                        self.req_id_to_symbol[req_id] = symbol
-                    time.sleep(0.2)  # Rate limiting
+                req_id = self.ibkr_client.request_market_data(symbol, contract, snapshot=True)
+                if req_id != -1:
+                    self._record_subscription(symbol, req_id, False)
                     
         except Exception as e:
             log_error(self.logger, e, "Error requesting ETF data")
     
-    def _subscribe_to_position_symbols(self):
-        """Subscribe to market data for position symbols"""
+    def _subscribe_to_position_symbols(self, refresh_all: bool):
+        """Subscribe to market data for new position symbols, or for all of them when refresh_all"""
         try:
-            positions = self.data_store.get_positions()
-
-            for position in positions:
-                symbol = position.get('symbol')
-
-                if position.get('position_type') in ['call', 'put']:
-                    contract_details = position.get('contract_details', {})
-                    strike = contract_details.get('strike')
-                    expiry = contract_details.get('expiry', '').replace('-', '')
-                    right = contract_details.get('right')
-                    symbol = f"{symbol}_{strike}_{expiry}_{right}"
-
-                if symbol:
-                    # For options, also request Greeks
-                    if position.get('position_type') in ['call', 'put']:
-                        self._subscribe_to_option_greeks(position)
-                    else:
-                        contract = self.ibkr_client.create_stock_contract(symbol)
-                        req_id = self._subscribe_to_symbol(symbol, contract) 
+            # Check once per pass; new positions stay queued until connected
+            if not self.ibkr_client.is_connected():
+                return
+            
+            # Options stream Greeks once subscribed, so only new (or failed) ones need a look
+            while True:
+                try:
+                    position = self.new_option_positions.get_nowait()
+                except queue.Empty:
+                    break
+                self.pending_option_positions[position['id']] = position
+            
+            now_mono = time.monotonic()
+            for pos_id in list(self.pending_option_positions):
+                failures, first_failure = self.option_failures.get(pos_id, (0, now_mono))
+                if failures >= OPTION_RETRY_LIMIT:
+                    if now_mono - first_failure < OPTION_RETRY_COOLDOWN:
+                        continue
+                    # Cooldown over; forget positions closed in the meantime, retry the rest afresh
+                    if not self.data_store.get_position(pos_id):
+                        del self.pending_option_positions[pos_id]
+                        del self.option_failures[pos_id]
+                        continue
+                    failures, first_failure = 0, now_mono
+                
+                if self._subscribe_to_option_greeks(self.pending_option_positions[pos_id]):
+                    del self.pending_option_positions[pos_id]
+                    self.option_failures.pop(pos_id, None)
+                else:
+                    self.option_failures[pos_id] = (failures + 1, first_failure)
+            
+            # Newly seen symbols; during a portfolio download many rows arrive one by one, so
+            # each wake only requests what isn't subscribed yet
+            symbols = set()
+            while self.new_position_symbols:
+                symbols.add(self.new_position_symbols.popleft())
+            
+            if refresh_all:
+                # Everything else is refreshed with a snapshot request once per interval, once per
+                # symbol even when several accounts hold it
+                symbols.update(
+                    position.get('symbol') for position in self.data_store.get_positions()
+                    if position.get('position_type') not in OPTION_POSITION_TYPES
+                )
+            else:
+                symbols.difference_update(self.subscriptions)
+            symbols.discard(None)
+            
+            for symbol in symbols:
+                contract = self.stock_contracts.get(symbol)
+                if contract is None:
+                    contract = self.stock_contracts[symbol] = self.ibkr_client.create_stock_contract(symbol)
+                self._subscribe_to_symbol(symbol, contract)
 
         except Exception as e:
             log_error(self.logger, e, "Error subscribing to position symbols")
     
-    def _subscribe_to_option_greeks(self, position: Dict):
-        """Subscribe to option Greeks"""
+    def _subscribe_to_option_greeks(self, position: Dict) -> bool:
+        """Subscribe to option Greeks, returns False if the request should be retried"""
         try:
             contract_details = position.get('contract_details', {})
             if not contract_details:
-                return
+                return True
             symbol = position['symbol']
             strike = contract_details.get('strike')
-            expiry = contract_details.get('expiry', '').replace('-', '')
+            expiry = contract_details.get('expiry', '')
             right = contract_details.get('right')
+            
+            # Streaming subscription already live; skip building contract and key
+            option_tuple = (symbol, strike, expiry, right)
+            option_key = self.subscribed_options.get(option_tuple)
+            if option_key:
+                self._index_option_position(option_key, position['id'])
+                self.position_id_to_option_key.setdefault(position['id'], option_key)
+                self.price_ticks.append(option_key)
+                return True
+            
+            expiry = expiry.replace('-', '')
             multiplier = contract_details.get('multiplier', '100')
 
             if strike and expiry and right:
-                option_contract = self.ibkr_client.create_option_contract(
-                    symbol=symbol,
-                    expiry=expiry,
-                    strike=strike,
-                    right=right,
-                    multiplier=multiplier,
-                    exchange=position.get('exchange', 'SMART')
-                )
+                option_contract = self.option_contracts.get(option_tuple)
+                if option_contract is None:
+                    option_contract = self.option_contracts[option_tuple] = self.ibkr_client.create_option_contract(
+                        symbol=symbol,
+                        expiry=expiry,
+                        strike=strike,
+                        right=right,
+                        multiplier=multiplier,
+                        exchange=position.get('exchange', 'SMART')
+                    )
                 option_key = f"{symbol}_{strike}_{expiry}_{right}"
+                self._index_option_position(option_key, position['id'])
+                self.position_id_to_option_key[position['id']] = option_key
                 req_id = self._subscribe_to_option_symbol(option_key, option_contract)
+                if req_id == -1:
+                    return False
+                self.subscribed_options[option_tuple] = option_key
+            
+            return True
                     
         except Exception as e:
             log_error(self.logger, e, f"Error subscribing to option Greeks for {position.get('symbol')}")
+            return False
+    
+    def _index_option_position(self, option_key: str, position_id: str):
+        """Publish a new id set for the option key (service thread only)"""
+        position_ids = self.option_key_to_position_ids.get(option_key, frozenset())
+        if position_id not in position_ids:
+            self.option_key_to_position_ids[option_key] = position_ids | {position_id}
     
     def _subscribe_to_symbol(self, symbol: str, contract) -> int:
         """Subscribe to market data for a symbol"""
         try:
-            if not self.ibkr_client.is_connected():
-                return -1
-            
+            # The client returns -1 itself when disconnected
             req_id = self.ibkr_client.request_market_data(symbol, contract, snapshot=True)
             if req_id != -1:
-                self.subscribed_symbols.add(symbol)
-                self.symbol_to_req_id[symbol] = req_id
-                self.req_id_to_symbol[req_id] = symbol
-                self.logger.debug(f"Subscribed to market data for {symbol}")
+                self._record_subscription(symbol, req_id, False)
+                self.logger.debug("Subscribed to market data for %s", symbol)
             
             return req_id
             
@@ -227,15 +360,11 @@ class MarketService:
     def _subscribe_to_option_symbol(self, symbol: str, contract) -> int:
         """Subscribe to market data for a symbol"""
         try:
-            if not self.ibkr_client.is_connected():
-                return -1
-            
+            # The client returns -1 itself when disconnected
             req_id = self.ibkr_client.request_option_market_data(symbol, contract, snapshot=True)
             if req_id != -1:
-                self.subscribed_symbols.add(symbol)
-                self.symbol_to_req_id[symbol] = req_id
-                self.req_id_to_symbol[req_id] = symbol
-                self.logger.debug(f"Subscribed to market data for {symbol}")
+                self._record_subscription(symbol, req_id, True)
+                self.logger.debug("Subscribed to market data for %s", symbol)
             
             return req_id
             
@@ -243,6 +372,18 @@ class MarketService:
             log_error(self.logger, e, f"Error subscribing to {symbol}")
             return -1
     
+    def _record_subscription(self, symbol: str, req_id: int, streaming: bool):
+        """Record the latest request for a symbol"""
+        subscription = Subscription(req_id, streaming)
+        with self._subscriptions_lock:
+            if symbol in self.subscriptions:
+                # Same keys, so replacing the value in place is safe for readers
+                self.subscriptions[symbol] = subscription
+            else:
+                subscriptions = {**self.subscriptions, symbol: subscription}
+                self._symbols_snapshot = tuple(subscriptions)
+                self.subscriptions = subscriptions
+    
     def _on_market_data_update(self, data: Dict):
         """Handle market data update from IBKR"""
         try:
@@ -250,7 +391,7 @@ class MarketService:
             req_id = data.get('req_id')
             tick_data = data.get('data', {})
 
-            if symbol not in self.subscribed_symbols:
+            if symbol not in self.subscriptions:
                 return
 
             if data.get('type') == 'greeks':
@@ -259,16 +400,19 @@ class MarketService:
             
             if symbol and tick_data:
                 # Update market data cache
-                if symbol not in self.market_data_cache:
-                    self.market_data_cache[symbol] = {}
-                
-                self.market_data_cache[symbol].update(tick_data)
-                self.market_data_cache[symbol]['last_update'] = datetime.now().isoformat()
+                market_data = self.market_data_cache[symbol]
+                market_data.update(tick_data)
+                market_data['last_update'] = datetime.now().isoformat()
                 
                 # Calculate change and change percentage
                 self._calculate_price_changes(symbol)
                 
-                self.logger.debug(f"Updated market data for {symbol}")
+                if symbol in self.etf_contracts:
+                    self.etf_ticks.append(symbol)
+                if 'last_price' in tick_data:
+                    self.price_ticks.append(symbol)
+                
+                self.logger.debug("Updated market data for %s", symbol)
                 
         except Exception as e:
             log_error(self.logger, e, "Error processing market data update")
@@ -280,27 +424,24 @@ class MarketService:
             symbol = greeks_data.get('symbol')
             
             if symbol and any(key in greeks_data for key in ['delta', 'gamma', 'theta', 'vega']):
-                # Find matching position and update Greeks
-                positions = self.data_store.get_positions()
+                # Find matching positions via the option key index
+                position_ids = self.option_key_to_position_ids.get(symbol)
+                if not position_ids:
+                    return
                 
-                for position in positions:
-                    if (position.get('symbol') == symbol and 
-                        position.get('position_type') in ['call', 'put']):
-                        
-                        position['greeks'] = {
-                            'delta': round(greeks_data.get('delta', 0), 4),
-                            'gamma': round(greeks_data.get('gamma', 0), 4),
-                            'theta': round(greeks_data.get('theta', 0), 4),
-                            'vega': round(greeks_data.get('vega', 0), 4),
-                            'iv': round(greeks_data.get('implied_vol', 0), 4),
-                            'last_update': datetime.now().isoformat()
-                        }
-                        
-                        # Update position in data store
-                        self.data_store.update_position(position)
-                        break
+                greeks = {
+                    'delta': round(greeks_data.get('delta', 0), 4),
+                    'gamma': round(greeks_data.get('gamma', 0), 4),
+                    'theta': round(greeks_data.get('theta', 0), 4),
+                    'vega': round(greeks_data.get('vega', 0), 4),
+                    'iv': round(greeks_data.get('implied_vol', 0), 4),
+                    'last_update': datetime.now().isoformat()
+                }
+                # Positions closed before the flush are skipped by patch_positions
+                for position_id in position_ids:
+                    self.greeks_ticks.append({'id': position_id, 'greeks': greeks})
                 
-                self.logger.debug(f"Updated Greeks for {symbol}")
+                self.logger.debug("Queued Greeks for %s", symbol)
                 
         except Exception as e:
             log_error(self.logger, e, "Error processing Greeks data")
@@ -325,18 +466,14 @@ class MarketService:
     def _update_market_data_store(self):
         """Update market data in data store"""
         try:
+            # Only ETFs that ticked since the last pass need pushing
+            updated_etfs = set()
+            while self.etf_ticks:
+                updated_etfs.add(self.etf_ticks.popleft())
+            
             # Update ETF data
             etf_data = {}
-            etf_mapping = {
-                'SPY': ('SPY', 'STK'),
-                'QQQ': ('QQQ', 'STK'), 
-                'VIX': ('VIX', 'IND'),
-                'DXY': ('DXY', 'IND'),
-                '^IXIC': ('COMP', 'IND'),  # NASDAQ Composite
-                '^TNX': ('TNX', 'IND')     # 10-Year Treasury
-            }
-
-            for symbol,(new_symbol,sec) in etf_mapping.items():
+            for symbol in updated_etfs:
                 market_data = self.market_data_cache.get(symbol, {})
                 if market_data:
                     etf_data[symbol] = {
@@ -357,66 +494,84 @@ class MarketService:
             # Update position prices
             self._update_position_prices()
             
+            self._flush_greeks()
+            
         except Exception as e:
             log_error(self.logger, e, "Error updating market data store")
     
+    def _flush_greeks(self):
+        """Write Greeks queued since the last pass to the store under one lock acquisition"""
+        latest = {}  # position id -> newest update, older ticks for the same option are dropped
+        while self.greeks_ticks:
+            update = self.greeks_ticks.popleft()
+            latest[update['id']] = update
+        if latest:
+            self.data_store.patch_positions(list(latest.values()))
+    
     def _update_position_prices(self):
         """Update current prices for positions"""
         try:
+            # Only positions whose symbol ticked since the last pass can have a new price
+            dirty = set()
+            while self.price_ticks:
+                dirty.add(self.price_ticks.popleft())
+            if not dirty:
+                return
+            
             positions = self.data_store.get_positions()
             updated_positions = []
             
+            # Bind lookups once outside the loop
+            get_market_data = self.market_data_cache.get
+            option_keys = self.position_id_to_option_key
+            option_types = OPTION_POSITION_TYPES
+            get_multiplier = POSITION_MULTIPLIERS.get
+            now_iso = datetime.now().isoformat()  # One timestamp per pass
+            
             for position in positions:
-                symbol = position.get('symbol')
+                # .get() with defaults: one incomplete row must not abort the pass for the rest
+                get = position.get
+                pos_id = get('id')
+                symbol = get('symbol')
+                position_type = get('position_type')
 
-                if position.get('position_type') in ['call', 'put']:
-                    contract_details = position.get('contract_details', {})
-                    strike = contract_details.get('strike')
-                    expiry = contract_details.get('expiry', '').replace('-', '')
-                    right = contract_details.get('right')
-                    symbol = f"{symbol}_{strike}_{expiry}_{right}"
+                if position_type in option_types:
+                    # Key (with IBKR-format expiry) was normalized once at subscription
+                    symbol = option_keys.get(pos_id)
+                    if not symbol:
+                        continue
 
-                market_data = self.market_data_cache.get(symbol, {})
+                if symbol not in dirty:
+                    continue
+
+                market_data = get_market_data(symbol)
 
                 if market_data and 'last_price' in market_data:
-                    old_price = position.get('current_price', 0)
                     new_price = market_data['last_price']
                     
-                    if new_price > 0 and new_price != old_price:
-                        # Update position with new price
-                        position = position.copy()
-                        position['current_price'] = round(new_price, 2)
-                        
-                        # Recalculate market value and P&L
-                        quantity = position.get('quantity', 0)
-                        avg_cost = position.get('avg_cost', 0)
-                        
-                        if position.get('position_type') == 'stock':
-                            market_value = quantity * new_price
-                            unrealized_pnl = (new_price - avg_cost) * quantity
-                        else:  # Options/Futures
-                            multiplier = 100 if position.get('position_type') in ['call', 'put'] else 1
-                            market_value = quantity * new_price * multiplier
-                            unrealized_pnl = (new_price - avg_cost) * quantity * multiplier
-                        
-                        position['market_value'] = round(market_value, 2)
-                        position['unrealized_pnl'] = round(unrealized_pnl, 2)
+                    if new_price > 0 and new_price != get('current_price', 0):
+                        # Recalculate market value and P&L (stocks and futures use a multiplier of 1)
+                        quantity = get('quantity', 0)
+                        avg_cost = get('avg_cost', 0)
+                        multiplier = get_multiplier(position_type, 1)
+                        market_value = quantity * new_price * multiplier
+                        unrealized_pnl = (new_price - avg_cost) * quantity * multiplier
                         
+                        # Only the changed fields; the store merges them into the live position
+                        update = {
+                            'id': pos_id,
+                            'current_price': round(new_price, 2),
+                            'market_value': round(market_value, 2),
+                            'unrealized_pnl': round(unrealized_pnl, 2),
+                            'last_update': now_iso
+                        }
                         if market_value != 0:
-                            position['unrealized_pnl_pct'] = round((unrealized_pnl / abs(market_value)) * 100, 2)
+                            update['unrealized_pnl_pct'] = round((unrealized_pnl / abs(market_value)) * 100, 2)
                         
-                        position['last_update'] = datetime.now().isoformat()
-                        updated_positions.append(position)
+                        updated_positions.append(update)
 
             if updated_positions:
-                # Update positions in data store
-                all_positions = self.data_store.get_positions()
-                position_dict = {pos['id']: pos for pos in all_positions}
-                
-                for updated_pos in updated_positions:
-                    position_dict[updated_pos['id']] = updated_pos
-                
-                self.data_store.update_positions(list(position_dict.values()))
+                self.data_store.patch_positions(updated_positions)
                 
         except Exception as e:
             log_error(self.logger, e, "Error updating position prices")
@@ -424,14 +579,18 @@ class MarketService:
     def _cancel_all_subscriptions(self):
         """Cancel all market data subscriptions"""
         try:
-            for req_id in list(self.req_id_to_symbol.keys()):
-                self.ibkr_client.cancel_market_data(req_id)
+            with self._subscriptions_lock:
+                subscriptions = self.subscriptions
+                self.subscriptions = {}
+                self._symbols_snapshot = ()
             
-            self.subscribed_symbols.clear()
-            self.symbol_to_req_id.clear()
-            self.req_id_to_symbol.clear()
+            cancelled = self.ibkr_client.cancel_market_data_batch(
+                [subscription.req_id for subscription in subscriptions.values() if subscription.streaming]
+            )
             
-            self.logger.info("Cancelled all market data subscriptions")
+            self.subscribed_options.clear()
+            
+            self.logger.info(f"Cancelled {cancelled} market data subscriptions")
             
         except Exception as e:
             log_error(self.logger, e, "Error cancelling subscriptions")
@@ -450,11 +609,13 @@ class MarketService:
     
     def get_subscription_stats(self) -> Dict:
         """Get subscription statistics"""
+        symbols = self._symbols_snapshot
+        
         return {
-            'subscribed_symbols': len(self.subscribed_symbols),
-            'symbols': list(self.subscribed_symbols),
+            'subscribed_symbols': len(symbols),
+            'symbols': symbols,
             'etf_contracts': len(self.etf_contracts),
             'market_data_cache': len(self.market_data_cache),
-            'last_etf_update': self.last_etf_update.isoformat(),
+            'last_etf_update': self.last_etf_update_iso,
             'running': self.is_running()
         }
\ No newline at end of file
@@ -1,12 +1,23 @@
+import random
+import sys
 import threading
 import time
 import hashlib
+from collections import defaultdict
 from datetime import datetime
+from functools import lru_cache
 from typing import Dict, List
 from utils.logger import setup_logger, log_error
 from core.ibkr_client import IBKRClient
 from core.data_store import DataStore
 
+@lru_cache(maxsize=4096)
+def _format_expiry(expiry_raw: str) -> str:
+    """Format an IBKR YYYYMMDD expiry as YYYY-MM-DD (cached, expiries repeat on every portfolio update)"""
+    if len(expiry_raw) == 8 and expiry_raw.isdigit():
+        return f"{expiry_raw[:4]}-{expiry_raw[4:6]}-{expiry_raw[6:8]}"
+    return expiry_raw
+
 class PositionService:
     """Service for managing positions data"""
     
@@ -18,11 +29,12 @@ class PositionService:
         # Service state
         self.running = False
         self.service_thread = None
+        self._wake = threading.Event()  # Set by stop() and force_refresh() to cut the wait short
         
         # Position tracking
         self.position_cache = {}
-        self.account_cache = {}
-        self.last_update = datetime.min
+        self.account_cache = defaultdict(dict)  # account -> {key: value}
+        self.last_update = float('-inf')  # time.monotonic() of last positions request
         
         self.logger.info("Position service initialized")
     
@@ -33,12 +45,13 @@ class PositionService:
             return
         
         self.running = True
-        self.service_thread = threading.Thread(target=self._run_service, daemon=True)
-        self.service_thread.start()
         
-        # Setup callbacks
+        # Setup callbacks before the thread can issue its first requests
         self._setup_callbacks()
         
+        self.service_thread = threading.Thread(target=self._run_service, daemon=True)
+        self.service_thread.start()
+        
         self.logger.info("Position service started")
     
     def stop(self):
@@ -47,6 +60,7 @@ class PositionService:
             return
         
         self.running = False
+        self._wake.set()
         
         if self.service_thread and self.service_thread.is_alive():
             self.service_thread.join(timeout=5)
@@ -57,19 +71,30 @@ class PositionService:
         """Main service loop"""
         try:
             # Initial position request
-            time.sleep(0.2)  # Wait for connection
+            if not self.ibkr_client.wait_until_ready(timeout=30):
+                self.logger.warning("IBKR connection not ready, continuing anyway")
             self._request_initial_data()
             
+            error_backoff = 0.5
             while self.running:
                 try:
+                    self._wake.clear()
+                    now_mono = time.monotonic()
+                    
                     # Periodic position updates
-                    if (datetime.now() - self.last_update).total_seconds() >= 30:
+                    if now_mono - self.last_update >= 30:
                         self._request_positions_update()
-                        self.last_update = datetime.now()
+                        self.last_update = now_mono
+                    
+                    # Sleep until the next update is due, or until stop()/force_refresh()
+                    self._wake.wait(timeout=max(0.0, self.last_update + 30 - time.monotonic()))
+                    error_backoff = 0.5
                     
                 except Exception as e:
                     log_error(self.logger, e, "Error in position service loop")
-                    time.sleep(1)
+                    # Exponential backoff with jitter; stop() cuts it short via _wake
+                    self._wake.wait(timeout=error_backoff + random.uniform(0, error_backoff * 0.1))
+                    error_backoff = min(error_backoff * 2, 30.0)
                     
         except Exception as e:
             log_error(self.logger, e, "Fatal error in position service")
@@ -86,10 +111,8 @@ class PositionService:
                 self.ibkr_client.request_positions()
                 
                 # Request account updates for managed accounts
-                accounts = self.ibkr_client.wrapper.managed_accounts.split(',')
-                for account in accounts:
-                    if account.strip():
-                        self.ibkr_client.request_account_updates(account.strip())
+                for account in self.ibkr_client.wrapper.managed_account_ids:
+                    self.ibkr_client.request_account_updates(account)
                 
                 self.logger.info("Requested initial position and account data")
         except Exception as e:
@@ -122,11 +145,10 @@ class PositionService:
                 pos_id = position['id']
                 self.position_cache[pos_id] = position
                 
-                # Update data store
-                positions_list = list(self.position_cache.values())
-                self.data_store.update_positions(positions_list)
+                # Only this row changed; the rest of the cache is already in the store
+                self.data_store.update_position(position)
                 
-                self.logger.debug(f"Updated position: {position['symbol']} ({position['position_type']})")
+                self.logger.debug("Updated position: %s (%s)", position['symbol'], position['position_type'])
                 
         except Exception as e:
             log_error(self.logger, e, "Error processing position update")
@@ -138,12 +160,9 @@ class PositionService:
             key = account_data['key']
             value = account_data['value']
             
-            if account_id not in self.account_cache:
-                self.account_cache[account_id] = {}
-            
             self.account_cache[account_id][key] = value
             
-            self.logger.debug(f"Updated account {account_id}: {key} = {value}")
+            self.logger.debug("Updated account %s: %s = %s", account_id, key, value)
             
         except Exception as e:
             log_error(self.logger, e, "Error processing account update")
@@ -173,7 +192,7 @@ class PositionService:
             
             position = {
                 'id': position_id,
-                'symbol': contract.symbol,
+                'symbol': sys.intern(contract.symbol),
                 'account': account,
                 'position_type': position_type,
                 'quantity': int(position_qty),
@@ -239,18 +258,14 @@ class PositionService:
             key_parts.append(contract.lastTradeDateOrContractMonth)
         
         key_string = '_'.join(key_parts)
-        return hashlib.md5(key_string.encode()).hexdigest()[:12]
+        # Interned: the same id keys the service cache, the data store and market service maps
+        return sys.intern(hashlib.md5(key_string.encode()).hexdigest()[:12])
     
     def _format_expiry(self, expiry_raw: str) -> str:
         """Format expiry date"""
         try:
-            if len(expiry_raw) == 8 and expiry_raw.isdigit():
-                year = expiry_raw[:4]
-                month = expiry_raw[4:6]
-                day = expiry_raw[6:8]
-                return f"{year}-{month}-{day}"
-            return expiry_raw
-        except:
+            return _format_expiry(expiry_raw)
+        except (TypeError, AttributeError):
             return expiry_raw
     
     def get_positions(self) -> List[Dict]:
@@ -263,7 +278,7 @@ class PositionService:
     
     def get_account_summary(self) -> Dict:
         """Get account summary"""
-        return self.account_cache.copy()
+        return dict(self.account_cache)
     
     def is_running(self) -> bool:
         """Check if service is running"""
@@ -272,7 +287,9 @@ class PositionService:
     def force_refresh(self):
         """Force refresh positions"""
         try:
-            self._request_positions_update()
+            # Make the update due now and wake the service thread to send it
+            self.last_update = float('-inf')
+            self._wake.set()
             self.logger.info("Forced position refresh")
         except Exception as e:
             log_error(self.logger, e, "Error forcing position refresh")
\ No newline at end of file
@@ -1,15 +1,21 @@
 import csv
+import random
+import sys
 import threading
 import time
 import yfinance as yf
-from datetime import datetime, timedelta
-from typing import Dict, List, Set, Optional
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import Dict, List, Optional
 from config import Config
 from utils.logger import setup_logger, log_error
 from core.ibkr_client import IBKRClient
 from core.data_store import DataStore
 from ibapi.contract import Contract, ContractDetails
 
+CHAIN_RETRY_INTERVAL = 300  # seconds before re-requesting a contract or option chain that never arrived
+
 class WatchlistService:
     """Service for managing options watchlist using yfinance for stock prices and IBKR for options"""
     
@@ -21,11 +27,14 @@ class WatchlistService:
         # Service state
         self.running = False
         self.service_thread = None
+        self._stop_event = threading.Event()  # Interrupts every wait in the service loop
         
         # Watchlist data
         self.watchlist_symbols = []
+        self.watchlist_symbol_set = frozenset()  # Read by IBKR callbacks; republished whenever the list changes
         self.watchlist_data = {}
         self.stock_data = {}
+        self.dirty_symbols = deque()  # Symbols changed since the last store push (appended by the IBKR thread too)
         
         # Contract and option chain data
         self.symbol_contracts = {}  # symbol -> Contract with conId
@@ -36,19 +45,24 @@ class WatchlistService:
         self.fixed_option_selections = {}  # symbol -> {strike, expiry, call_contract, put_contract}
         
         # Subscription tracking
-        self.option_subscriptions = set()
+        self.option_subscriptions = {}  # option_key -> streaming req_id
+        self.option_key_info = {}       # option_key -> (symbol, strike, expiry, right, option_type), parsed once
         
         # Request tracking for callbacks
         self.contract_detail_requests = {}  # req_id -> symbol
         self.option_param_requests = {}     # req_id -> symbol
+        self.chain_requested_at = {}        # symbol -> time.monotonic() of the last contract/option chain request
         self.next_req_id = 5000
         
         # Update timing
-        self.last_stock_update = datetime.min
-        self.last_option_update = datetime.min
+        self.last_stock_update = float('-inf')   # time.monotonic() of last yfinance refresh
+        self.last_option_update = float('-inf')  # time.monotonic() of last option stream check
+        self.last_stock_update_iso = datetime.min.isoformat()   # Wall-clock counterparts, for stats only
+        self.last_option_update_iso = datetime.min.isoformat()
         
         # yfinance tickers
         self.yf_tickers = {}
+        self.yf_pool = None  # Owned by the service thread, one per start()
         
         # Setup additional callbacks
         self._setup_contract_callbacks()
@@ -62,12 +76,14 @@ class WatchlistService:
             return
         
         self.running = True
-        self.service_thread = threading.Thread(target=self._run_service, daemon=True)
-        self.service_thread.start()
+        self._stop_event.clear()
         
-        # Setup callbacks
+        # Setup callbacks before the thread can issue its first requests
         self._setup_callbacks()
         
+        self.service_thread = threading.Thread(target=self._run_service, daemon=True)
+        self.service_thread.start()
+        
         self.logger.info("Watchlist service started")
     
     def stop(self):
@@ -76,6 +92,10 @@ class WatchlistService:
             return
         
         self.running = False
+        self._stop_event.set()
+        
+        # Cancel streaming option subscriptions
+        self._cancel_option_subscriptions()
         
         if self.service_thread and self.service_thread.is_alive():
             self.service_thread.join(timeout=5)
@@ -84,9 +104,13 @@ class WatchlistService:
     
     def _run_service(self):
         """Main service loop"""
+        # Created and shut down here so a stop()/start() cycle gets a fresh pool and
+        # the loop never submits to one that is already shut down
+        self.yf_pool = ThreadPoolExecutor(max_workers=8, thread_name_prefix='yfinance')
         try:
             # Wait for connection and load watchlist
-            time.sleep(1)
+            if not self.ibkr_client.wait_until_ready(timeout=30):
+                self.logger.warning("IBKR connection not ready, continuing anyway")
             self._load_watchlist()
             
             # Setup yfinance tickers
@@ -96,13 +120,15 @@ class WatchlistService:
             self._request_contract_details()
             
             # Wait for contract details to be received
-            time.sleep(3)
+            if self._stop_event.wait(3):
+                return
             
             # Request option parameters for symbols with contract IDs
             self._request_option_parameters()
             
             # Wait for option chains to be received
-            time.sleep(5)
+            if self._stop_event.wait(5):
+                return
             
             self._update_stock_data_yfinance()
 
@@ -112,35 +138,60 @@ class WatchlistService:
             # Subscribe to option data for fixed selections
             self._subscribe_to_fixed_options()
             
+            error_backoff = 0.5
+            next_deadline = time.monotonic()
             while self.running:
                 try:
-                    current_time = datetime.now()
+                    now_mono = time.monotonic()
                     
                     # Update stock data from yfinance periodically (every 10 seconds)
-                    if (current_time - self.last_stock_update).total_seconds() >= 10:
+                    if now_mono - self.last_stock_update >= 10:
                         self._update_stock_data_yfinance()
-                        self.last_stock_update = current_time
+                        self.last_stock_update = now_mono
+                        self.last_stock_update_iso = datetime.now().isoformat()
                     
                     # Update option data (every 5 seconds)
-                    if (current_time - self.last_option_update).total_seconds() >= 5:
+                    if now_mono - self.last_option_update >= 5:
                         self._request_option_data_updates()
-                        self.last_option_update = current_time
+                        self.last_option_update = now_mono
+                        self.last_option_update_iso = datetime.now().isoformat()
+                    
+                    # Pick up symbols whose contract or option chain is still missing
+                    self._retry_missing_chains()
                     
                     # Update data store
                     self._update_watchlist_store()
                     
-                    time.sleep(2)  # Main loop interval
+                    # Main loop interval, measured from the previous deadline so work time doesn't add drift
+                    next_deadline += 2
+                    delay = next_deadline - time.monotonic()
+                    if delay > 0:
+                        self._stop_event.wait(delay)
+                    else:
+                        next_deadline = time.monotonic()  # Overran; resync instead of bursting
+                    error_backoff = 0.5
                     
                 except Exception as e:
                     log_error(self.logger, e, "Error in watchlist service loop")
-                    time.sleep(2)
+                    # Exponential backoff with jitter
+                    self._stop_event.wait(error_backoff + random.uniform(0, error_backoff * 0.1))
+                    error_backoff = min(error_backoff * 2, 30.0)
                     
         except Exception as e:
             log_error(self.logger, e, "Fatal error in watchlist service")
+        finally:
+            self.yf_pool.shutdown(wait=False)
     
     def _setup_callbacks(self):
         """Setup IBKR market data callbacks"""
         self.ibkr_client.register_market_data_callback(self._on_market_data_update)
+        self.ibkr_client.register_connection_callback(self._on_connection_status)
+    
+    def _on_connection_status(self, status: Dict):
+        """Forget option streams when the link drops so the next update pass resubscribes them"""
+        if status.get('status') in ('disconnected', 'error') and self.option_subscriptions:
+            self.option_subscriptions = {}
+            self.logger.warning("IBKR connection lost, option subscriptions will be renewed")
     
     def _setup_contract_callbacks(self):
         """Setup contract detail and option parameter callbacks"""
@@ -158,7 +209,7 @@ class WatchlistService:
             with open(Config.WATCHLIST_FILE, 'r') as file:
                 reader = csv.DictReader(file)
                 for row in reader:
-                    symbol = row['symbol'].strip().upper()
+                    symbol = sys.intern(row['symbol'].strip().upper())
                     enabled = row['enabled'].strip().lower() == 'true'
                     
                     if enabled:
@@ -171,6 +222,8 @@ class WatchlistService:
             # Fallback to default symbols
             self.watchlist_symbols = ['AAPL', 'MSFT', 'TSLA', 'GOOG']
             self.logger.info(f"Using fallback symbols: {self.watchlist_symbols}")
+        
+        self.watchlist_symbol_set = frozenset(self.watchlist_symbols)
     
     def _setup_yfinance_tickers(self):
         """Setup yfinance ticker objects"""
@@ -187,57 +240,70 @@ class WatchlistService:
     def _update_stock_data_yfinance(self):
         """Update stock data using yfinance"""
         try:
-            for symbol in self.watchlist_symbols:
-                if symbol in self.yf_tickers:
-                    ticker = self.yf_tickers[symbol]
-                    
-                    # Get current price and basic info
-                    try:
-                        info = ticker.info
-                        hist = ticker.history(period="2d", interval="1m")
-                        
-                        if not hist.empty and info:
-                            current_price = hist['Close'].iloc[-1]
-                            previous_close = info.get('previousClose', current_price)
-                            
-                            # Calculate change
-                            change = current_price - previous_close
-                            change_pct = (change / previous_close) * 100 if previous_close > 0 else 0
-                            
-                            # Get additional data
-                            volume = hist['Volume'].iloc[-1] if not hist.empty else 0
-                            high = hist['High'].max() if not hist.empty else current_price
-                            low = hist['Low'].min() if not hist.empty else current_price
-                            self.logger.info(f"YF: Updating stock data for {symbol}: ${current_price:.2f} (Change: {change_pct:+.2f}%)")
-                            self.stock_data[symbol] = {
-                                'last_price': round(float(current_price), 2),
-                                'previous_close': round(float(previous_close), 2),
-                                'change': round(float(change), 2),
-                                'change_pct': round(float(change_pct), 2),
-                                'volume': int(volume),
-                                'high': round(float(high), 2),
-                                'low': round(float(low), 2),
-                                'last_update': datetime.now().isoformat()
-                            }
-                            
-                            self.logger.info(f"Updated stock data for {symbol}: ${current_price:.2f} ({change_pct:+.2f}%)")
-                            
-                    except Exception as e:
-                        self.logger.warning(f"Failed to get yfinance data for {symbol}: {e}")
+            symbols = [symbol for symbol in self.watchlist_symbols if symbol in self.yf_tickers]
+            
+            # Each symbol is two blocking HTTP calls; fetch them concurrently
+            results = self.yf_pool.map(self._fetch_stock_data_yfinance, symbols)
+            for symbol, stock_data in zip(symbols, results):
+                if stock_data:
+                    self.stock_data[symbol] = stock_data
+                    self.dirty_symbols.append(symbol)
                         
         except Exception as e:
             log_error(self.logger, e, "Error updating stock data from yfinance")
     
-    def _request_contract_details(self):
+    def _fetch_stock_data_yfinance(self, symbol: str) -> Optional[Dict]:
+        """Fetch current stock data for one symbol from yfinance"""
+        try:
+            ticker = self.yf_tickers[symbol]
+            
+            # Get current price and basic info
+            info = ticker.info
+            hist = ticker.history(period="2d", interval="1m")
+            
+            if not hist.empty and info:
+                current_price = hist['Close'].iloc[-1]
+                previous_close = info.get('previousClose', current_price)
+                
+                # Calculate change
+                change = current_price - previous_close
+                change_pct = (change / previous_close) * 100 if previous_close > 0 else 0
+                
+                # Get additional data
+                volume = hist['Volume'].iloc[-1] if not hist.empty else 0
+                high = hist['High'].max() if not hist.empty else current_price
+                low = hist['Low'].min() if not hist.empty else current_price
+                self.logger.info(f"YF: Updating stock data for {symbol}: ${current_price:.2f} (Change: {change_pct:+.2f}%)")
+                stock_data = {
+                    'last_price': round(float(current_price), 2),
+                    'previous_close': round(float(previous_close), 2),
+                    'change': round(float(change), 2),
+                    'change_pct': round(float(change_pct), 2),
+                    'volume': int(volume),
+                    'high': round(float(high), 2),
+                    'low': round(float(low), 2),
+                    'last_update': datetime.now().isoformat()
+                }
+                
+                self.logger.info(f"Updated stock data for {symbol}: ${current_price:.2f} ({change_pct:+.2f}%)")
+                return stock_data
+                
+        except Exception as e:
+            self.logger.warning(f"Failed to get yfinance data for {symbol}: {e}")
+        
+        return None
+    
+    def _request_contract_details(self, symbols: List[str] = None):
         """Request contract details to get contract IDs for symbols"""
         try:
             if not self.ibkr_client.is_connected():
                 self.logger.warning("IBKR not connected, cannot request contract details")
                 return
             
-            for symbol in self.watchlist_symbols:
+            for symbol in symbols if symbols is not None else self.watchlist_symbols:
                 req_id = self._get_next_req_id()
                 self.contract_detail_requests[req_id] = symbol
+                self.chain_requested_at[symbol] = time.monotonic()
                 
                 # Create stock contract for contract details request
                 contract = Contract()
@@ -246,26 +312,28 @@ class WatchlistService:
                 contract.currency = "USD"
                 contract.exchange = "SMART"
                 
+                self.ibkr_client.acquire_pacing()
                 self.ibkr_client.reqContractDetails(req_id, contract)
-                self.logger.debug(f"Requested contract details for {symbol} (req_id: {req_id})")
-                
-                time.sleep(0.5)  # Rate limiting
+                self.logger.debug("Requested contract details for %s (req_id: %s)", symbol, req_id)
                 
         except Exception as e:
             log_error(self.logger, e, "Error requesting contract details")
     
-    def _request_option_parameters(self):
+    def _request_option_parameters(self, symbols: List[str] = None):
         """Request option parameters for symbols with contract IDs"""
         try:
             if not self.ibkr_client.is_connected():
                 self.logger.warning("IBKR not connected, cannot request option parameters")
                 return
             
-            for symbol, contract in self.symbol_contracts.items():
-                if hasattr(contract, 'conId') and contract.conId:
+            for symbol in symbols if symbols is not None else list(self.symbol_contracts):
+                contract = self.symbol_contracts.get(symbol)
+                if contract is not None and contract.conId:
                     req_id = self._get_next_req_id()
                     self.option_param_requests[req_id] = symbol
+                    self.chain_requested_at[symbol] = time.monotonic()
                     
+                    self.ibkr_client.acquire_pacing()
                     self.ibkr_client.reqSecDefOptParams(
                         req_id,
                         contract.symbol,
@@ -275,17 +343,62 @@ class WatchlistService:
                     )
                     
                     self.logger.info(f"Requested option parameters for {symbol} (conId: {contract.conId}, req_id: {req_id})")
-                    time.sleep(0.5)  # Rate limiting
                 else:
                     self.logger.warning(f"No contract ID available for {symbol}")
                     
         except Exception as e:
             log_error(self.logger, e, "Error requesting option parameters")
     
+    def _retry_missing_chains(self):
+        """Re-request contracts and option chains that have not arrived within CHAIN_RETRY_INTERVAL"""
+        try:
+            if not self.ibkr_client.is_connected():
+                return
+            
+            now_mono = time.monotonic()
+            due = [
+                symbol for symbol in self.watchlist_symbols
+                if symbol not in self.option_chains
+                and now_mono - self.chain_requested_at.get(symbol, float('-inf')) >= CHAIN_RETRY_INTERVAL
+            ]
+            if due:
+                missing_contracts = [symbol for symbol in due if symbol not in self.symbol_contracts]
+                missing_chains = [symbol for symbol in due if symbol in self.symbol_contracts]
+                
+                # Forget the unanswered requests so late replies can't double up. Pruned in place
+                # from a list() copy because the IBKR thread pops from these dicts concurrently
+                due_set = set(due)
+                for requests in (self.contract_detail_requests, self.option_param_requests):
+                    for req_id, symbol in list(requests.items()):
+                        if symbol in due_set:
+                            requests.pop(req_id, None)
+                
+                if missing_contracts:
+                    self.logger.info(f"Retrying contract details for: {missing_contracts}")
+                    self._request_contract_details(missing_contracts)
+                if missing_chains:
+                    self.logger.info(f"Retrying option parameters for: {missing_chains}")
+                    self._request_option_parameters(missing_chains)
+            
+            # Select and subscribe options for chains that completed since the last pass
+            pending_params = set(self.option_param_requests.values())
+            if any(
+                symbol in self.option_chains and symbol not in self.fixed_option_selections
+                and symbol not in pending_params and self.stock_data.get(symbol, {}).get('last_price', 0) > 0
+                for symbol in self.watchlist_symbols
+            ):
+                self._calculate_fixed_option_selections()
+                self._subscribe_to_fixed_options()
+                
+        except Exception as e:
+            log_error(self.logger, e, "Error retrying missing option chains")
+    
     def _calculate_fixed_option_selections(self):
         """Calculate fixed option selections (ATM strike + farthest expiry) - done once"""
         try:
             for symbol in self.watchlist_symbols:
+                if symbol in self.fixed_option_selections:
+                    continue
                 if symbol in self.option_chains and symbol in self.stock_data:
                     stock_price = self.stock_data[symbol].get('last_price', 0)
                     if stock_price > 0:
@@ -302,15 +415,24 @@ class WatchlistService:
                             # Create option contracts
                             call_contract = self._create_option_contract(symbol, atm_strike, selected_expiry, 'C')
                             put_contract = self._create_option_contract(symbol, atm_strike, selected_expiry, 'P')
+                            
+                            # Keys are built once here; tick handlers look their parts up instead of parsing
+                            call_key = sys.intern(f"{symbol}_{atm_strike}_{selected_expiry}_C")
+                            put_key = sys.intern(f"{symbol}_{atm_strike}_{selected_expiry}_P")
+                            self.option_key_info[call_key] = (symbol, atm_strike, selected_expiry, 'C', 'call')
+                            self.option_key_info[put_key] = (symbol, atm_strike, selected_expiry, 'P', 'put')
 
                             self.fixed_option_selections[symbol] = {
                                 'strike': atm_strike,
                                 'expiry': selected_expiry,
                                 'call_contract': call_contract,
                                 'put_contract': put_contract,
+                                'call_key': call_key,
+                                'put_key': put_key,
                                 'selected_at': datetime.now().isoformat(),
                                 'stock_price_at_selection': stock_price
                             }
+                            self.dirty_symbols.append(symbol)
                             
                             self.logger.info(f"Fixed option selection for {symbol}: "
                                             f"Strike=${atm_strike}, Expiry={selected_expiry}, "
@@ -337,57 +459,70 @@ class WatchlistService:
             for symbol, selection in self.fixed_option_selections.items():
                 call_contract = selection['call_contract']
                 put_contract = selection['put_contract']
-                strike = selection['strike']
-                expiry = selection['expiry']
                 
-                # Subscribe to call option
-                call_key = f"{symbol}_{strike}_{expiry}_C"
-                req_id = self.ibkr_client.request_option_market_data(call_key, call_contract, snapshot=False)
-                if req_id != -1:
-                    self.option_subscriptions.add(call_key)
-                    self.logger.debug(f"Subscribed to call option: {call_key}")
-                    time.sleep(0.5)
+                # Subscribe to call option (already streaming ones are left alone)
+                call_key = selection['call_key']
+                if call_key not in self.option_subscriptions:
+                    req_id = self.ibkr_client.request_option_market_data(call_key, call_contract, snapshot=False)
+                    if req_id != -1:
+                        self.option_subscriptions[call_key] = req_id
+                        self.logger.debug("Subscribed to call option: %s", call_key)
                 
                 # Subscribe to put option
-                put_key = f"{symbol}_{strike}_{expiry}_P"
-                req_id = self.ibkr_client.request_option_market_data(put_key, put_contract, snapshot=False)
-                if req_id != -1:
-                    self.option_subscriptions.add(put_key)
-                    self.logger.debug(f"Subscribed to put option: {put_key}")
-                    time.sleep(0.5)
+                put_key = selection['put_key']
+                if put_key not in self.option_subscriptions:
+                    req_id = self.ibkr_client.request_option_market_data(put_key, put_contract, snapshot=False)
+                    if req_id != -1:
+                        self.option_subscriptions[put_key] = req_id
+                        self.logger.debug("Subscribed to put option: %s", put_key)
                         
         except Exception as e:
             log_error(self.logger, e, "Error subscribing to fixed options")
     
-    def _request_option_data_updates(self):
-        """Request fresh option data for fixed selections"""
+    def _cancel_option_subscriptions(self):
+        """Cancel all streaming option subscriptions in one batch"""
         try:
-            for symbol, selection in self.fixed_option_selections.items():
-                if self.ibkr_client.is_connected():
-                    call_contract = selection['call_contract']
-                    put_contract = selection['put_contract']
-                    strike = selection['strike']
-                    expiry = selection['expiry']
-                    
-                    # Request call option data
-                    call_key = f"{symbol}_{strike}_{expiry}_C"
-                    self.ibkr_client.request_option_market_data(call_key, call_contract, snapshot=True)
-                    time.sleep(0.3)
-                    
-                    # Request put option data
-                    put_key = f"{symbol}_{strike}_{expiry}_P"
-                    self.ibkr_client.request_option_market_data(put_key, put_contract, snapshot=True)
-                    time.sleep(0.3)
-                    
+            cancelled = self.ibkr_client.cancel_market_data_batch(list(self.option_subscriptions.values()))
+            
+            self.option_subscriptions.clear()
+            self.logger.info(f"Cancelled {cancelled} option subscriptions")
+            
         except Exception as e:
-            log_error(self.logger, e, "Error requesting option data updates")
+            log_error(self.logger, e, "Error cancelling option subscriptions")
+    
+    def _cancel_symbol_option_subscriptions(self, symbol: str):
+        """Cancel the option streams of one underlying in a single batch"""
+        prefix = f"{symbol}_"
+        req_ids = [
+            self.option_subscriptions.pop(option_key)
+            for option_key in [key for key in self.option_subscriptions if key.startswith(prefix)]
+        ]
+        if req_ids:
+            self.ibkr_client.cancel_market_data_batch(req_ids)
+    
+    def _request_option_data_updates(self):
+        """Make sure every fixed selection has a live option stream"""
+        # Subscriptions stream continuously, so re-requesting them would only open duplicate
+        # streams and burn pacing budget; only selections without a stream are (re)subscribed
+        if self.ibkr_client.is_connected():
+            self._subscribe_to_fixed_options()
     
     def _update_watchlist_store(self):
         """Update watchlist data in data store"""
         try:
+            # Only symbols whose stock, option or selection data changed need pushing
+            dirty = set()
+            while self.dirty_symbols:
+                dirty.add(self.dirty_symbols.popleft())
+            if not dirty:
+                return
+            
             updated_watchlist = {}
+            now_iso = datetime.now().isoformat()  # One timestamp per pass
             
             for symbol in self.watchlist_symbols:
+                if symbol not in dirty:
+                    continue
                 stock_data = self.stock_data.get(symbol, {})
                 selection = self.fixed_option_selections.get(symbol, {})
                 
@@ -414,7 +549,7 @@ class WatchlistService:
                             'selected_at': selection.get('selected_at', ''),
                             'stock_price_at_selection': selection.get('stock_price_at_selection', 0)
                         },
-                        'last_update': datetime.now().isoformat()
+                        'last_update': now_iso
                     }
             
             if updated_watchlist:
@@ -462,8 +597,8 @@ class WatchlistService:
         """Handle end of contract details"""
         symbol = self.contract_detail_requests.get(req_id)
         if symbol:
-            self.logger.debug(f"Contract details completed for {symbol}")
-            del self.contract_detail_requests[req_id]
+            self.logger.debug("Contract details completed for %s", symbol)
+            self.contract_detail_requests.pop(req_id, None)  # May already be pruned by _retry_missing_chains
     
     def _on_security_definition_option_parameter(self, req_id: int, exchange: str, 
                                                 underlying_con_id: int, trading_class: str,
@@ -486,8 +621,8 @@ class WatchlistService:
                 self.option_chains[symbol]['exchanges'].add(exchange)
                 self.option_chains[symbol]['multipliers'].add(multiplier)
                 
-                self.logger.debug(f"Received option params for {symbol} on {exchange}: "
-                                f"{len(expirations)} expiries, {len(strikes)} strikes")
+                self.logger.debug("Received option params for %s on %s: %d expiries, %d strikes",
+                                  symbol, exchange, len(expirations), len(strikes))
             
         except Exception as e:
             log_error(self.logger, e, f"Error handling option parameters for req_id {req_id}")
@@ -501,15 +636,15 @@ class WatchlistService:
                 
                 # Convert sets to sorted lists for easier processing
                 if 'expirations' in chain_data:
-                    chain_data['expirations'] = sorted(list(chain_data['expirations']))
+                    chain_data['expirations'] = sorted(chain_data['expirations'])
                 if 'strikes' in chain_data:
-                    chain_data['strikes'] = sorted(list(chain_data['strikes']))
+                    chain_data['strikes'] = sorted(chain_data['strikes'])
                 
                 self.logger.info(f"Option chain completed for {symbol}: "
                                f"{len(chain_data.get('expirations', []))} expiries, "
                                f"{len(chain_data.get('strikes', []))} strikes")
                 
-                del self.option_param_requests[req_id]
+                self.option_param_requests.pop(req_id, None)  # May already be pruned by _retry_missing_chains
             
         except Exception as e:
             log_error(self.logger, e, f"Error handling option parameters end for req_id {req_id}")
@@ -529,7 +664,7 @@ class WatchlistService:
                 return
             
             # Handle option data (ignore stock data since we use yfinance)
-            if '_' in symbol_key and any(ws in symbol_key for ws in self.watchlist_symbols):
+            if '_' in symbol_key and symbol_key.split('_', 1)[0] in self.watchlist_symbol_set:
                 self._process_option_data(symbol_key, tick_data)
                 
         except Exception as e:
@@ -539,48 +674,35 @@ class WatchlistService:
         """Process Greeks data for options"""
         try:
             greeks_data = data.get('data', {})
-            symbol_key = greeks_data.get('symbol', '')
-            
-            if '_' in symbol_key:
-                parts = symbol_key.split('_')
-                if len(parts) >= 4:
-                    base_symbol = parts[0]
-                    strike = float(parts[1])
-                    expiry = parts[2]
-                    right = parts[3]
+            info = self.option_key_info.get(greeks_data.get('symbol', ''))
+            
+            if info:
+                base_symbol, strike, expiry, right, option_type = info
+                
+                if base_symbol in self.watchlist_data:
+                    if 'options' not in self.watchlist_data[base_symbol]:
+                        self.watchlist_data[base_symbol]['options'] = {}
+                    if option_type not in self.watchlist_data[base_symbol]['options']:
+                        self.watchlist_data[base_symbol]['options'][option_type] = {}
+                    
+                    self.watchlist_data[base_symbol]['options'][option_type]['greeks'] = {
+                        'delta': round(greeks_data.get('delta', 0), 4),
+                        'gamma': round(greeks_data.get('gamma', 0), 4),
+                        'theta': round(greeks_data.get('theta', 0), 4),
+                        'vega': round(greeks_data.get('vega', 0), 4),
+                        'iv': round(greeks_data.get('implied_vol', 0), 4)
+                    }
+                    self.dirty_symbols.append(base_symbol)
                     
-                    if base_symbol in self.watchlist_data:
-                        option_type = 'call' if right == 'C' else 'put'
-                        
-                        if base_symbol not in self.watchlist_data:
-                            self.watchlist_data[base_symbol] = {'options': {}}
-                        if 'options' not in self.watchlist_data[base_symbol]:
-                            self.watchlist_data[base_symbol]['options'] = {}
-                        if option_type not in self.watchlist_data[base_symbol]['options']:
-                            self.watchlist_data[base_symbol]['options'][option_type] = {}
-                        
-                        self.watchlist_data[base_symbol]['options'][option_type]['greeks'] = {
-                            'delta': round(greeks_data.get('delta', 0), 4),
-                            'gamma': round(greeks_data.get('gamma', 0), 4),
-                            'theta': round(greeks_data.get('theta', 0), 4),
-                            'vega': round(greeks_data.get('vega', 0), 4),
-                            'iv': round(greeks_data.get('implied_vol', 0), 4)
-                        }
-                        
         except Exception as e:
             log_error(self.logger, e, "Error processing option Greeks")
     
     def _process_option_data(self, option_key: str, tick_data: Dict):
         """Process option market data"""
         try:
-            parts = option_key.split('_')
-            if len(parts) >= 4:
-                base_symbol = parts[0]
-                strike = float(parts[1])
-                expiry = parts[2]
-                right = parts[3]
-                
-                option_type = 'call' if right == 'C' else 'put'
+            info = self.option_key_info.get(option_key)
+            if info:
+                base_symbol, strike, expiry, right, option_type = info
                 
                 if base_symbol not in self.watchlist_data:
                     self.watchlist_data[base_symbol] = {'options': {}}
@@ -614,8 +736,9 @@ class WatchlistService:
                         option_data['change_pct'] = round(change_pct, 2)
                     
                     option_data['last_update'] = datetime.now().isoformat()
+                    self.dirty_symbols.append(base_symbol)
                     
-                    self.logger.debug(f"Updated option data for {option_key}: ${new_price:.2f}")
+                    self.logger.debug("Updated option data for %s: $%.2f", option_key, new_price)
                             
         except Exception as e:
             log_error(self.logger, e, f"Error processing option data for {option_key}")
@@ -647,9 +770,7 @@ class WatchlistService:
             for sym in symbols_to_update:
                 if sym in self.option_chains and sym in self.stock_data:
                     # Cancel existing subscriptions for this symbol
-                    for option_key in list(self.option_subscriptions):
-                        if option_key.startswith(f"{sym}_"):
-                            self.option_subscriptions.discard(option_key)
+                    self._cancel_symbol_option_subscriptions(sym)
                     
                     # Remove old selection
                     self.fixed_option_selections.pop(sym, None)
@@ -668,9 +789,10 @@ class WatchlistService:
     def add_symbol(self, symbol: str):
         """Add symbol to watchlist"""
         try:
-            symbol = symbol.upper()
+            symbol = sys.intern(symbol.upper())
             if symbol not in self.watchlist_symbols:
                 self.watchlist_symbols.append(symbol)
+                self.watchlist_symbol_set = self.watchlist_symbol_set | {symbol}
                 
                 # Setup yfinance ticker
                 self.yf_tickers[symbol] = yf.Ticker(symbol)
@@ -686,6 +808,8 @@ class WatchlistService:
                 contract.currency = "USD"
                 contract.exchange = "SMART"
                 
+                self.chain_requested_at[symbol] = time.monotonic()
+                self.ibkr_client.acquire_pacing()
                 self.ibkr_client.reqContractDetails(req_id, contract)
                 
                 self.logger.info(f"Added {symbol} to watchlist")
@@ -699,6 +823,7 @@ class WatchlistService:
             symbol = symbol.upper()
             if symbol in self.watchlist_symbols:
                 self.watchlist_symbols.remove(symbol)
+                self.watchlist_symbol_set = self.watchlist_symbol_set - {symbol}
                 
                 # Clean up data
                 self.stock_data.pop(symbol, None)
@@ -707,11 +832,13 @@ class WatchlistService:
                 self.option_chains.pop(symbol, None)
                 self.fixed_option_selections.pop(symbol, None)
                 self.yf_tickers.pop(symbol, None)
+                self.chain_requested_at.pop(symbol, None)
                 
                 # Remove option subscriptions
-                for option_key in list(self.option_subscriptions):
+                self._cancel_symbol_option_subscriptions(symbol)
+                for option_key in list(self.option_key_info):
                     if option_key.startswith(f"{symbol}_"):
-                        self.option_subscriptions.discard(option_key)
+                        self.option_key_info.pop(option_key, None)
                 
                 self.logger.info(f"Removed {symbol} from watchlist")
                 
@@ -733,7 +860,7 @@ class WatchlistService:
             'option_subscriptions': len(self.option_subscriptions),
             'yf_tickers_count': len(self.yf_tickers),
             'watchlist_data_count': len(self.watchlist_data),
-            'last_stock_update': self.last_stock_update.isoformat(),
-            'last_option_update': self.last_option_update.isoformat(),
+            'last_stock_update': self.last_stock_update_iso,
+            'last_option_update': self.last_option_update_iso,
             'running': self.is_running()
         }
\ No newline at end of file
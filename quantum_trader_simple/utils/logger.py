@@ -3,13 +3,12 @@ import sys
 import traceback
 from config import Config
 
-def setup_logger(name='quantum_trader'):
-    """Setup simple logging"""
-    logger = logging.getLogger(name)
-    
-    if not logger.handlers:
-        logger.setLevel(getattr(logging, Config.LOG_LEVEL))
-        
+_handlers = None  # Console and file handlers shared by every named logger
+
+def _get_handlers():
+    """Create the shared handlers on first use"""
+    global _handlers
+    if _handlers is None:
         formatter = logging.Formatter(
             '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
         )
@@ -17,16 +16,27 @@ def setup_logger(name='quantum_trader'):
         # Console handler
         console_handler = logging.StreamHandler(sys.stdout)
         console_handler.setFormatter(formatter)
-        logger.addHandler(console_handler)
         
-        # File handler
+        # File handler (one open file for the whole process)
         file_handler = logging.FileHandler('quantum_trader.log')
         file_handler.setFormatter(formatter)
-        logger.addHandler(file_handler)
+        
+        _handlers = (console_handler, file_handler)
+    return _handlers
+
+def setup_logger(name='quantum_trader'):
+    """Setup simple logging"""
+    logger = logging.getLogger(name)
+    
+    if not logger.handlers:
+        logger.setLevel(getattr(logging, Config.LOG_LEVEL))
+        
+        for handler in _get_handlers():
+            logger.addHandler(handler)
     
     return logger
 
 def log_error(logger, error, context=""):
     """Log error with traceback"""
     logger.error(f"{context}: {str(error)}")
-    logger.error(f"Traceback: {traceback.format_exc()}")
\ No newline at end of file
+    logger.error(f"Traceback: {traceback.format_exc()}")